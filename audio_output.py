@@ -0,0 +1,173 @@
+import numpy as np
+import threading
+import time
+
+class RingBuffer:
+    # A fixed-size, preallocated float32 ring buffer for one producer (the render thread) and one consumer (the
+    # audio callback). Each side only ever advances its own position, so no lock is needed.
+    def __init__(self, capacity: int):
+        self.data = np.zeros(capacity, dtype=np.float32)
+        self.capacity = capacity
+        self.read_pos = 0
+        self.write_pos = 0
+        self.underruns = 0
+        self.overruns = 0
+
+    def available(self) -> int:
+        return self.write_pos - self.read_pos
+
+    def space(self) -> int:
+        return self.capacity - self.available()
+
+    def write(self, data: np.array) -> bool:
+        n = len(data)
+        if n > self.space():
+            self.overruns += 1
+            return False
+        start = self.write_pos % self.capacity
+        first = min(n, self.capacity - start)
+        self.data[start:start + first] = data[:first]
+        self.data[:n - first] = data[first:]
+        self.write_pos += n
+        return True
+
+    def read(self, out: np.array) -> int:
+        # Fill out from the buffer, padding with silence (and counting an underrun) if there isn't enough data.
+        n = min(len(out), self.available())
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        if n < len(out):
+            out[n:] = 0
+            self.underruns += 1
+        self.read_pos += n
+        return n
+
+    def peek(self, out: np.array) -> int:
+        # Copy up to len(out) samples into out without consuming them. Returns the number of samples copied.
+        n = min(len(out), self.available())
+        start = self.read_pos % self.capacity
+        first = min(n, self.capacity - start)
+        out[:first] = self.data[start:start + first]
+        out[first:n] = self.data[:n - first]
+        return n
+
+    def skip(self, n: int):
+        self.read_pos += min(n, self.available())
+
+class PyAudioBackend:
+    # Plays through PyAudio in callback mode.
+    def __init__(self, sample_rate: int, frames_per_buffer: int):
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+
+    def open(self, callback):
+        import pyaudio
+        def stream_callback(in_data, frame_count, time_info, status):
+            return (callback(frame_count), pyaudio.paContinue)
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paFloat32,
+                        channels=1,
+                        rate=self.sample_rate,
+                        frames_per_buffer=self.frames_per_buffer,
+                        output=True,
+                        stream_callback=stream_callback)
+        self.stream.start_stream()
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
+
+class NullBackend:
+    # Pulls audio from the callback on its own thread like a sound card would, but throws it away, so callback output
+    # can be run without a sound card. With realtime=False it pulls as fast as the callback allows.
+    def __init__(self, sample_rate: int, frames_per_buffer: int, realtime: bool = True):
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+        self.realtime = realtime
+        self.frames_played = 0
+        self.running = False
+        self.thread = None
+
+    def run(self, callback):
+        start_time = time.perf_counter()
+        while self.running:
+            callback(self.frames_per_buffer)
+            self.frames_played += self.frames_per_buffer
+            if self.realtime:
+                delay = start_time + self.frames_played / self.sample_rate - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+    def open(self, callback):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(callback,))
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+class CallbackOutput:
+    # Decouples rendering from device I/O: a render thread keeps the ring buffer a few blocks ahead by calling render
+    # (which returns one block), and the backend's callback only copies out of the ring buffer.
+    def __init__(self, render, block_size: int, backend, blocks_ahead: int = 4):
+        self.render = render
+        self.block_size = block_size
+        self.backend = backend
+        self.ring = RingBuffer(block_size * blocks_ahead)
+        self.block = np.zeros(block_size, dtype=np.float32)
+        self.out = np.zeros(block_size, dtype=np.float32)
+        self.space_event = threading.Event()
+        self.running = False
+        self.thread = None
+
+    @property
+    def underruns(self) -> int:
+        return self.ring.underruns
+
+    @property
+    def overruns(self) -> int:
+        return self.ring.overruns
+
+    def callback(self, frame_count: int) -> bytes:
+        if frame_count > len(self.out):
+            self.out = np.zeros(frame_count, dtype=np.float32)
+        out = self.out[:frame_count]
+        self.ring.read(out)
+        self.space_event.set()
+        return out.tobytes()
+
+    def render_thread(self):
+        while self.running:
+            self.space_event.clear()
+            if self.ring.space() < self.block_size:
+                # Wait for the callback to make room.
+                self.space_event.wait(0.1)
+                continue
+            self.fill()
+
+    def fill(self):
+        while self.ring.space() >= self.block_size:
+            np.copyto(self.block, self.render())
+            self.ring.write(self.block)
+
+    def start(self):
+        # Prime the ring buffer so the first callbacks don't underrun.
+        self.fill()
+        self.running = True
+        self.thread = threading.Thread(target=self.render_thread)
+        self.thread.start()
+        self.backend.open(self.callback)
+
+    def stop(self):
+        self.running = False
+        self.space_event.set()
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        self.backend.close()
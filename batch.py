@@ -0,0 +1,110 @@
+import argparse
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+import midicache
+from render import render_file, add_render_arguments, render_options
+
+@dataclass
+class BatchResult:
+    input: str
+    output: str
+    num_notes: int = 0
+    frames: int = 0
+    parse_time: float = 0
+    render_time: float = 0
+    error: str = None
+
+def find_midi_files(paths: list) -> list:
+    # Expand directories into the MIDI files inside them, sorted so batches always run in the same order. Returns
+    # (path, name) pairs, where name is the file's path relative to the directory it was found in (or just its file
+    # name, for files given directly), so that outputs can mirror the layout of the inputs.
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files += [(os.path.join(root, name), os.path.relpath(os.path.join(root, name), path)) for name in names if name.lower().endswith(('.mid', '.midi'))]
+        else:
+            files.append((path, os.path.basename(path)))
+    return sorted(files)
+
+def output_path(name: str, out_dir: str) -> str:
+    return os.path.join(out_dir, os.path.splitext(name)[0] + '.wav')
+
+def run_job(job: tuple) -> BatchResult:
+    # Parse and render (or just parse) one file. Runs in a worker process, so failures are caught and reported
+    # rather than taking down the whole batch.
+    input, output, options = job
+    result = BatchResult(input, output)
+    try:
+        if output is None:
+            start_time = time.perf_counter()
+            notes, _, _ = midicache.parse_midi_cached(input, options['cache_dir'], options['cache_max_mb'] << 20)
+            result.num_notes = len(notes)
+            result.parse_time = time.perf_counter() - start_time
+        else:
+            os.makedirs(os.path.dirname(output), exist_ok=True)
+            result.num_notes, result.frames, result.parse_time, result.render_time = render_file(input, output, **options)
+    except Exception:
+        result.error = traceback.format_exc()
+    return result
+
+def run_batch(files: list, out_dir: str, options: dict, jobs: int = None) -> list:
+    # Fan the files ((path, name) pairs from find_midi_files) out over a process pool. Results come back in the same
+    # order as files. Files that would be rendered to the same output as an earlier one fail up front instead of
+    # overwriting it.
+    batch = []
+    results = {}
+    outputs = {}
+    for i, (path, name) in enumerate(files):
+        output = None if out_dir is None else output_path(name, out_dir)
+        if output is not None:
+            key = os.path.normcase(os.path.abspath(output))
+            if key in outputs:
+                results[i] = BatchResult(path, output, error=f"{output} would also be written by {outputs[key]}\n")
+                continue
+            outputs[key] = path
+        batch.append((i, (path, output, options)))
+
+    with ProcessPoolExecutor(jobs) as executor:
+        for (i, _), result in zip(batch, executor.map(run_job, [job for _, job in batch])):
+            results[i] = result
+    return [results[i] for i in range(len(files))]
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse and render many MIDI files in parallel.")
+    parser.add_argument('inputs', nargs='+', help="MIDI files, or directories to search for MIDI files")
+    parser.add_argument('--out-dir', default='renders', help="directory to write the WAV files to")
+    parser.add_argument('--parse-only', action='store_true', help="only parse the files, don't render them")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes (defaults to the number of CPUs)")
+    add_render_arguments(parser)
+    args = parser.parse_args()
+
+    files = find_midi_files(args.inputs)
+    start_time = time.perf_counter()
+    results = run_batch(files, None if args.parse_only else args.out_dir, render_options(args), args.jobs)
+    elapsed = time.perf_counter() - start_time
+
+    failed = 0
+    audio = 0
+    for result in results:
+        if result.error:
+            failed += 1
+            print(f"FAILED {result.input}:\n{result.error}")
+            continue
+        if args.parse_only:
+            print(f"{result.input}: {result.num_notes} notes, parsed in {result.parse_time:.3f}s")
+            continue
+        duration = result.frames / args.sample_rate
+        audio += duration
+        print(f"{result.input}: {result.num_notes} notes, {duration:.2f}s of audio, parsed in {result.parse_time:.3f}s, rendered in {result.render_time:.3f}s")
+
+    if args.parse_only:
+        print(f"{len(results) - failed}/{len(results)} files parsed in {elapsed:.2f}s, {failed} failed")
+    else:
+        print(f"{len(results) - failed}/{len(results)} files in {elapsed:.2f}s ({audio / elapsed:.1f}x realtime overall), {failed} failed")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+import numpy as np
+from scipy.ndimage import minimum_filter1d
+from scipy.signal import lfilter
+
+class Compressor:
+    # A feed-forward compressor/limiter for the master bus that works on whole blocks at a time. The gain is
+    # computed for every sample at once, then
+    # - held at its lowest for lookahead samples (the audio is delayed by the same amount, so the gain is already down
+    #   when a peak comes out),
+    # - smoothed with a moving average over attack samples, so it ramps down instead of jumping, and
+    # - released with a one-pole filter over release samples, by taking whichever of the two is lower.
+    # With lookahead at least as long as attack and an infinite ratio nothing gets past the threshold. Every step is
+    # a handful of array operations, so the cost per block doesn't depend on what is playing.
+    def __init__(self, sample_rate: int, threshold_db: float = -6, ratio: float = 4, attack_ms: float = 5, release_ms: float = 100, lookahead_ms: float = 0, makeup_db: float = 0):
+        self.threshold_db = threshold_db
+        self.ratio = ratio
+        self.makeup_db = makeup_db
+        self.lookahead = int(sample_rate * lookahead_ms / 1000)
+        self.attack = max(int(sample_rate * attack_ms / 1000), 1)
+        if self.lookahead:
+            self.attack = min(self.attack, self.lookahead + 1)
+        release = max(sample_rate * release_ms / 1000, 1)
+        coefficient = np.exp(-1 / release)
+        self.release_b = np.array([1 - coefficient])
+        self.release_a = np.array([1, -coefficient])
+        self.reset()
+
+    @classmethod
+    def limiter(cls, sample_rate: int, ceiling_db: float = -1, lookahead_ms: float = 5, release_ms: float = 50):
+        return cls(sample_rate, ceiling_db, np.inf, lookahead_ms, release_ms, lookahead_ms)
+
+    def reset(self):
+        # The end of the previous block: the input still to be played, the gain to hold and the gain to average.
+        self.delay = np.zeros(self.lookahead, dtype=np.float32)
+        self.gain_history = np.zeros(self.lookahead)
+        self.held_history = np.zeros(self.attack - 1)
+        self.release_state = np.zeros(1)
+        self.gain_reduction_db = 0.
+
+    def gain_computer(self, samples: np.array) -> np.array:
+        # The gain (in dB, never above 0) that brings every sample's level down to the compression curve.
+        level_db = 20 * np.log10(np.maximum(np.abs(samples), 1e-9))
+        slope = 1 if np.isinf(self.ratio) else 1 - 1 / self.ratio
+        return np.minimum((self.threshold_db - level_db) * slope, 0)
+
+    def process(self, samples: np.array, out: np.array = None) -> np.array:
+        # Compress one block of any length. out may be samples itself.
+        n = len(samples)
+        gain = np.concatenate((self.gain_history, self.gain_computer(samples)))
+        if self.lookahead:
+            # The lowest gain of the last lookahead + 1 samples.
+            size = self.lookahead + 1
+            held = minimum_filter1d(gain, size, mode='nearest')[size // 2:size // 2 + n]
+            self.gain_history = gain[-self.lookahead:]
+        else:
+            held = gain
+
+        # Moving average over attack samples.
+        history = np.concatenate((self.held_history, held))
+        totals = np.cumsum(np.concatenate(([0], history)))
+        attacked = (totals[self.attack:] - totals[:-self.attack]) / self.attack
+        if self.attack > 1:
+            self.held_history = history[-(self.attack - 1):]
+
+        released, self.release_state = lfilter(self.release_b, self.release_a, held, zi=self.release_state)
+        gain_db = np.minimum(attacked, released)
+        self.gain_reduction_db = float(gain_db.min(initial=0))
+        gain = np.power(10, (gain_db + self.makeup_db) / 20)
+
+        if self.lookahead:
+            delayed = np.concatenate((self.delay, samples))
+            self.delay = delayed[n:].copy()
+            samples = delayed[:n]
+        if out is None:
+            out = np.empty(n, dtype=np.float32)
+        np.multiply(samples, gain, out=out, casting='unsafe')
+        return out
+
+    def process_offline(self, samples: np.array) -> np.array:
+        # Compress a whole recording at once, without the lookahead delay: the output lines up with samples.
+        padded = np.concatenate((samples, np.zeros(self.lookahead, dtype=samples.dtype)))
+        return self.process(padded)[self.lookahead:]
+
+COMPRESSORS = ['none', 'compressor', 'limiter']
+
+def make_compressor(name: str, sample_rate: int) -> Compressor:
+    # A compressor with default settings by name ('compressor' or 'limiter'), or None for 'none'.
+    if name == 'compressor':
+        return Compressor(sample_rate)
+    if name == 'limiter':
+        return Compressor.limiter(sample_rate)
+    if name == 'none':
+        return None
+    raise ValueError(f"unknown compressor {name!r}")
+
+if __name__ == '__main__':
+    import time
+
+    SAMPLE_RATE = 44100
+    BLOCK_SIZE = SAMPLE_RATE * 30 // 1000
+    BLOCKS = 1000
+
+    rng = np.random.default_rng(0)
+    block = (rng.standard_normal(BLOCK_SIZE) * 0.5).astype(np.float32)
+    for name, compressor in [
+        ("compressor", Compressor(SAMPLE_RATE, -12, 4)),
+        ("compressor, 5ms lookahead", Compressor(SAMPLE_RATE, -12, 4, lookahead_ms=5)),
+        ("limiter, 5ms lookahead", Compressor.limiter(SAMPLE_RATE)),
+    ]:
+        out = np.empty(BLOCK_SIZE, dtype=np.float32)
+        start_time = time.perf_counter()
+        for _ in range(BLOCKS):
+            compressor.process(block, out)
+        elapsed = (time.perf_counter() - start_time) / BLOCKS
+        print(f"{name}: {elapsed * 1e+6:.0f}us per 30ms block ({elapsed / 0.03 * 100:.2f}% of realtime)")
+
+    # A limiter must keep every sample under its ceiling, whatever comes in.
+    limiter = Compressor.limiter(SAMPLE_RATE, -1)
+    loud = (rng.standard_normal(SAMPLE_RATE) * 4).astype(np.float32)
+    peak = max(np.abs(limiter.process(loud[i:i + BLOCK_SIZE])).max() for i in range(0, len(loud), BLOCK_SIZE))
+    print(f"limiter: input peak {20 * np.log10(np.abs(loud).max()):.1f}dB, output peak {20 * np.log10(peak):.2f}dB")
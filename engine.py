@@ -0,0 +1,239 @@
+import numpy as np
+import threading
+import time
+import wave
+from midi_input import EventQueue, NOTE_ON
+from oscillator import OscillatorBank
+from wavetable import make_wavetables
+from tuning import calculate_pitch_et, TuningTable
+from voices import VoiceTable, STEAL_OLDEST
+
+SAMPLE_RATE = 44100
+TIMEOUT = 30
+
+class Recorder:
+    # Base class for anything that wants to record what the engine plays. write_block is called from the audio
+    # thread with every rendered block, note_on/note_off with every note event before the block it happens in, offset
+    # samples into that block.
+    def write_block(self, buffer: np.array):
+        pass
+
+    def note_on(self, pitch: int, velocity: int, channel: int = 0, offset: int = 0):
+        pass
+
+    def note_off(self, pitch: int, channel: int = 0, offset: int = 0):
+        pass
+
+    def close(self):
+        pass
+
+class WaveRecordContext(Recorder):
+    def __init__(self, file, sample_rate: int = SAMPLE_RATE):
+        self.file = file
+        self.wave = wave.open(file, 'wb')
+        self.wave.setnchannels(1)
+        self.wave.setsampwidth(4)
+        self.wave.setframerate(sample_rate)
+
+    def write_block(self, buffer: np.array):
+        # Clip in float64, so loud blocks (and full scale itself) can't wrap around to the other end of the int32 range.
+        samples = np.clip(np.asarray(buffer, dtype=np.float64) / 1.414, -1, 1)
+        self.wave.writeframes((samples * 2147483647).astype(np.int32).tobytes())
+
+    def close(self):
+        self.wave.close()
+        self.file.close()
+
+class SynthEngine:
+    # The synth itself, without any UI: voice management, tuning, rendering and recording. All of the settings are
+    # plain attributes, so they can be set from any thread; the audio thread reads each of them once per block.
+    def __init__(self, sample_rate: int = SAMPLE_RATE, timeout: int = TIMEOUT, polyphony: int = 64, steal_policy: str = STEAL_OLDEST):
+        self.sample_rate = sample_rate
+        self.timeout = timeout
+        self.polyphony = polyphony
+        self.steal_policy = steal_policy
+        self.block_size = int(sample_rate * timeout / 1000)
+        self.running = False
+        self.thread = None
+
+        # Settings.
+        self.volume = 100
+        self.hertz = 0
+        self.et = 12
+        self.calculate_pitch = calculate_pitch_et
+        self.wave_type = 'sine'
+        self.should_attack_decay_smoothing = True
+        # A dynamics.Compressor for the master bus, or None.
+        self.compressor = None
+
+        # MIDI events are pushed here from any single producer thread and applied at the start of the next block.
+        self.events = EventQueue()
+
+        # Recorders are swapped as a whole list, never mutated, so the audio thread always sees a consistent one.
+        # Blocks are counted as they start and finish, so a recorder can be closed once no block is still using it.
+        self.recorders = []
+        self.blocks_started = 0
+        self.blocks_finished = 0
+
+        # Sound generation vars.
+        self.num_frames_count = 0
+        self.voices = VoiceTable(polyphony, steal_policy)
+        self.base = np.arange(self.block_size)
+        self.buffer = np.zeros(self.block_size)
+        self.oscillators = OscillatorBank(self.block_size, sample_rate, polyphony)
+        self.wavetables = make_wavetables(sample_rate)
+        self.smoothing_length = self.block_size
+        self.tuning_table = TuningTable(sample_rate)
+
+    def add_recorder(self, recorder: Recorder):
+        self.recorders = self.recorders + [recorder]
+
+    def remove_recorder(self, recorder: Recorder, wait: bool = False):
+        # With wait, also wait for the block being rendered (if any) to finish, since it may still be using the old
+        # list. Every later block sees the new one, so the recorder can then be closed from this thread.
+        self.recorders = [r for r in self.recorders if r is not recorder]
+        if not wait:
+            return
+        started = self.blocks_started
+        deadline = time.perf_counter() + 1
+        while self.blocks_finished < started and time.perf_counter() < deadline:
+            time.sleep(0.001)
+
+    def note_on(self, pitch: int, velocity: int, channel: int = 0, offset: int = 0):
+        # Start a note at offset samples into the next block. Only call this from the thread that renders, or before
+        # rendering starts; other threads should push events instead.
+        self.voices.note_on(pitch, velocity, channel, offset)
+        for recorder in self.recorders:
+            recorder.note_on(pitch, velocity, channel, offset)
+
+    def note_off(self, pitch: int, channel: int = 0, offset: int = 0):
+        # Recorders get every note-off, even when the voice is already gone (stolen, or faded out): they record the
+        # keys that were played, not the voices that sounded, and ignore note-offs for notes they aren't holding.
+        self.voices.note_off(pitch, channel, offset)
+        for recorder in self.recorders:
+            recorder.note_off(pitch, channel, offset)
+
+    def apply_events(self):
+        # Place every event received since the last block at the same position in this block, so timing is kept
+        # to the sample at the cost of exactly one block of latency.
+        now = time.perf_counter()
+        block_start = now - self.block_size / self.sample_rate
+        for event in self.events.drain():
+            offset = min(max(int((event.time - block_start) * self.sample_rate), 0), self.block_size - 1)
+            if event.type == NOTE_ON:
+                self.note_on(event.pitch, event.velocity, event.channel, offset)
+            else:
+                self.note_off(event.pitch, event.channel, offset)
+
+    def render(self) -> np.array:
+        self.blocks_started += 1
+        self.apply_events()
+
+        # Take a snapshot of the settings for this block.
+        volume = self.volume
+        self.tuning_table.update(self.calculate_pitch, self.et, self.hertz)
+        increments = self.tuning_table.increments
+        wavetable = self.wavetables[self.wave_type]
+        fade = self.smoothing_length if self.should_attack_decay_smoothing else 0
+
+        # Zero the buffer and calculate the sounds.
+        self.buffer -= self.buffer
+        voices = self.voices
+        slots = voices.active_slots()
+        if len(slots):
+            self.oscillators.set_increment(slots, increments[voices.pitch[slots]])
+            starts = voices.start[slots]
+            releases = voices.release[slots]
+            is_new = voices.is_new[slots]
+            if is_new.any():
+                # Start new voices at zero phase on the sample of their note-on.
+                self.oscillators.set_phase(slots[is_new], starts[is_new])
+
+            # Render every voice at once, one row per voice.
+            sound = self.oscillators.render_wavetable(slots, wavetable)
+            sound *= (voices.velocity[slots] / 400 * (volume / 100))[:, None]
+
+            # Apply the attack/decay envelope to the voices that start or stop during this block.
+            changing = (starts + fade > 0) | (releases < self.block_size)
+            if changing.any():
+                start = starts[changing, None]
+                release = releases[changing, None]
+                if fade:
+                    envelope = np.clip((self.base - start) / fade, 0, 1)
+                    envelope *= np.clip((release + fade - self.base) / fade, 0, 1)
+                else:
+                    envelope = (self.base >= start) & (self.base < release)
+                sound[changing] *= envelope
+            np.sum(sound, axis=0, out=self.buffer)
+
+        # Keep running the compressor when nothing is playing, so its delay line and release tail play out.
+        compressor = self.compressor
+        if compressor is not None:
+            compressor.process(self.buffer, out=self.buffer)
+
+        voices.advance(self.block_size, fade)
+        self.num_frames_count += 1
+        if voices.count() == 0:
+            self.num_frames_count = 0
+
+        for recorder in self.recorders:
+            recorder.write_block(self.buffer)
+        self.blocks_finished += 1
+        return self.buffer
+
+    def run(self, stream):
+        # Render blocks and write them to stream (anything with a blocking write(bytes)) until stopped.
+        while self.running:
+            stream.write(self.render().astype(np.float32).tobytes())
+
+    def reset(self):
+        self.voices = VoiceTable(self.polyphony, self.steal_policy)
+        self.oscillators = OscillatorBank(self.block_size, self.sample_rate, self.polyphony)
+        self.num_frames_count = 0
+
+    def start(self, stream):
+        self.reset()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(stream,))
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+if __name__ == '__main__':
+    # Profile the render loop headless, without a sound card or a display.
+    import os
+    import tempfile
+
+    VOICES = 64
+    BLOCKS = 1000
+
+    engine = SynthEngine()
+    for i in range(VOICES):
+        engine.note_on(36 + i, 100)
+    start_time = time.perf_counter()
+    for _ in range(BLOCKS):
+        engine.render()
+    elapsed = (time.perf_counter() - start_time) / BLOCKS
+    print(f"{VOICES} voices: {elapsed * 1000:.3f}ms per {engine.timeout}ms block ({engine.timeout / 1000 / elapsed:.1f}x realtime)")
+
+    # A dense, loud chord goes well past full scale; recording it must clip rather than wrap around.
+    engine = SynthEngine()
+    engine.wave_type = 'square'
+    for pitch in range(60, 68):
+        engine.note_on(pitch, 127)
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, 'chord.wav')
+        record = WaveRecordContext(open(path, 'wb'))
+        peak = 0
+        for _ in range(10):
+            buffer = engine.render()
+            peak = max(peak, np.abs(buffer).max())
+            record.write_block(buffer)
+        record.close()
+        with wave.open(path, 'rb') as f:
+            recorded = np.frombuffer(f.readframes(f.getnframes()), dtype='<i4')
+    print(f"dense chord: peak {peak / 1.414:.2f}x full scale, recorded {recorded.min()} to {recorded.max()}, {np.count_nonzero(recorded == -2**31)} samples wrapped to INT_MIN")
@@ -2,6 +2,10 @@ import numpy as np
 from numpy.fft import fft, fftfreq
 import matplotlib.pyplot as plt
 from scipy.io import wavfile
+import stft
+import logfreq
+import transcribe
+import midi
 
 rate, samples = wavfile.read("test.wav")
 total_samples = len(samples)
@@ -31,50 +35,25 @@ THRESHOLD = 5e+7
 #     plt.show()
 
 def get_notes_on_frame(frame_fft, freq_index_to_note):
-    notes = []
-    for i, v in enumerate(frame_fft):
-        if (v - 5e-7) < THRESHOLD:
-            continue
-        print(v)
-        if freq_index_to_note[i] not in notes:
-            notes.append(freq_index_to_note[i])
-
-    return notes        
+    return np.unique(freq_index_to_note[frame_fft - 5e-7 >= THRESHOLD]).tolist()
 
 def calculate_freq_index_to_note(freqs):
-    freq_index_to_note = []
-    for freq in freqs:
-        best_note = None
-        best_dist = None
-        for note, note_freq in enumerate(NOTES):
-            dist = abs(note_freq - freq)
-            if best_dist == None:
-                best_note = note
-                best_dist = dist
-                continue
-            if dist < best_dist:
-                best_dist = dist
-                best_note = note
-        
-        freq_index_to_note.append(best_note)
-
-    return freq_index_to_note
+    # The nearest of NOTES to every frequency, found with log2 and rounding instead of a search.
+    return np.clip(transcribe.freqs_to_notes(freqs), 0, len(NOTES) - 1)
 
 def fft_over_time():
     fft_width = 44100//10
-    image = np.zeros((int(total_samples / fft_width), int(fft_width/2))) # we divide width by 2 since fft gives a mirrored image
-    for current_stride in range(int(total_samples / fft_width)):
-        fft_out = np.abs(fft(samples[current_stride * fft_width : current_stride * fft_width + fft_width]))
-        image[current_stride] = fft_out[int(fft_width/2):]
-
-    freqs = fftfreq(fft_width, 1./rate)
-    plt.imshow(image.T, extent=[0, total_samples / rate, freqs[0], freqs[int(fft_width/2)-1]], aspect=.001)
+    image = stft.stft(samples, fft_width, window=None)
+    freqs = stft.stft_freqs(fft_width, rate)
+    # Show one row per note, so the music isn't crammed into the bottom rows.
+    note_freqs = logfreq.tuning_freqs('et', 12, rate=rate)
+    notes_image = image @ logfreq.make_kernel(note_freqs, fft_width, rate)
+    plt.imshow(notes_image.T, origin='lower', extent=[0, total_samples / rate, 0, len(note_freqs)], aspect='auto')
     plt.show()
-    print("a")
-    freq_index_to_note = calculate_freq_index_to_note(freqs)
-    for frame in image:
-        # cut off the high freqs and process
-        print(get_notes_on_frame(frame[:len(frame) // 4], freq_index_to_note))
+    notes = transcribe.transcribe(samples, rate)
+    for note in notes:
+        print(f"{note['start']:.2f}s {midi.num_to_str(int(note['pitch']))} ({note['pitch']}) for {note['duration']:.2f}s, velocity {note['velocity']}")
+    transcribe.write_midi(notes, "transcribed.mid")
 
 def fft_freqs():
     Y = abs(fft(samples))
@@ -3,102 +3,33 @@ import tkinter.messagebox
 from tkinter import ttk, filedialog
 import rtmidi
 import pyaudio
-import numpy as np
-import threading
-from dataclasses import dataclass
 import os
-import wave
-import tempfile
-import shutil
-import time
-from midiutil.MidiFile import MIDIFile
-
-SAMPLE_RATE = 44100
-TIMEOUT = 30
+from engine import SynthEngine, SAMPLE_RATE, TIMEOUT
+from midi_input import make_midi_callback
+from audio_output import CallbackOutput, PyAudioBackend
+from recording import make_recorder, RECORD_FORMATS
+from midirecord import SMFRecorder
+from dynamics import Compressor
+from tuning import calculate_pitch_et, calculate_pitch_young, calculate_pitch_werckmeister, scala_tuning
+
 ICON = 'synth.ico'
 import sys
 if getattr(sys, 'frozen', False):
     ICON = os.path.join(sys._MEIPASS, ICON)
 
-@dataclass
-class Note:
-    pitch: int
-    velocity: int
-    is_new: bool
-    should_remove: bool
-
-@dataclass
-class MIDINote:
-    pitch: int
-    velocity: int
-    start_time: float
-
-def calculate_pitch_et(pitch, et):
-    return pow(2, (pitch - 69) / et) * 440
-
-# Thomas Young 1799 temperament, based on https://www.math.uwaterloo.ca/~mrubinst/tuning/tuning.html.
-YOUNG_RATIOS = [1,1.055730636,1.119771437,1.187696971,1.253888072,1.334745462,1.407640848,1.496510232,1.583595961,1.675749414,1.781545449,1.878842233]
-
-def calculate_pitch_young(pitch, _):
-    # Thomas Young 1799 temperament (based on C=256).
-    return 256 * YOUNG_RATIOS[(pitch) % 12] * pow(2, pitch // 12 - 5)
-
-# Werckmeister temperament, based on https://en.wikipedia.org/wiki/Werckmeister_temperament.
-WERCKMEISTER_RATIOS = [
-    1/1, 256/243, 64/81 * pow(2, 1/2), 32/27, 256/243 * pow(2, 1/4), 4/3, 1024/729, 8/9 * pow(2 ** 3, 1/4), 128/81, 1024/729 * pow(2, 1/4), 16/9, 128/81 * pow(2, 1/4)
-]
-
-def calculate_pitch_werckmeister(pitch, _):
-    # Werckmeister temperament (based on C=256).
-    return 256 * WERCKMEISTER_RATIOS[(pitch) % 12] * pow(2, pitch // 12 - 5)
-
-class MIDIRecordContext:
-    def __init__(self, file):
-        self.midi = MIDIFile(1)
-        self.time = time.time()
-        self.file = file
-        self.midi.addTrackName(0, 0, "KSYNTH")
-        self.midi.addTempo(0, 0, 120)
-        self.current_notes = []
-    
-    def note_on(self, note):
-        midi_note = MIDINote(note.pitch, note.velocity, time.time())
-        self.current_notes.append(midi_note)
-
-    def find_note(self, num):
-        # Find the note.
-        for i, temp in enumerate(self.current_notes):
-            if num == temp.pitch:
-                # Found the note.
-                return i
-
-    def note_off(self, num):
-        i = self.find_note(num)
-        if not i:
-            return
-        note_start = (self.current_notes[i].start_time - self.time) * 2 # Calculate number of beats (120 bpm)
-        duration = (time.time() - self.current_notes[i].start_time) * 2 # Calculate duration
-        self.midi.addNote(0, 0, self.current_notes[i].pitch, note_start, duration, self.current_notes[i].velocity)
-        del self.current_notes[i]
-
-    def close(self):
-        self.midi.writeFile(self.file)
-        self.file.close()
-        
 class SynthInterface:
     def __init__(self, title="KSYNTH"):
         self.title = title
         self.running = False
         self.record = None
         self.record_midi = None
+        self.engine = SynthEngine(SAMPLE_RATE, TIMEOUT)
 
         # Settings.
         self.port = None
-        self.volume = 100
-        self.hertz = 0
-        self.et = 12
-        self.should_attack_decay_smoothing = True
-        self.calculate_pitch = calculate_pitch_et
+        self.use_callback_output = True
+        self.compression_level = 5
+        self.scala_tuning = None
 
     def get_midi_inputs(self):
         return [self.midi.getPortName(i) for i in range(self.midi.getPortCount())]
@@ -165,18 +96,32 @@ class SynthInterface:
         self.tuning_type_young_radiobutton.pack()
         self.tuning_type_werck_radiobutton = ttk.Radiobutton(self.frame_center, text="12-tone Werckmeister temperament", variable=self.tuning_type, value="werckmeister", command=self.update_tuning_type)
         self.tuning_type_werck_radiobutton.pack()
+        self.tuning_type_scala_radiobutton = ttk.Radiobutton(self.frame_center, text="Scala file (.scl/.kbm)", variable=self.tuning_type, value="scala", command=self.update_tuning_type)
+        self.tuning_type_scala_radiobutton.pack()
+        self.load_scala_button = ttk.Button(self.frame_center, text="Load Scala Tuning...", command=self.load_scala_tuning)
+        self.load_scala_button.pack()
+        self.scala_label_var = tkinter.StringVar(self.root, "No Scala tuning loaded.")
+        self.scala_label = tkinter.Label(self.frame_center, textvariable=self.scala_label_var)
+        self.scala_label.pack()
         self.tuning_type.set("et")
         
         self.should_attack_decay_smoothing_checkbox = ttk.Checkbutton(self.frame_right, text="Apply attack/decay smoothing", onvalue=True, offvalue=False, command=self.update_should_attack_decay_smoothing)
         self.should_attack_decay_smoothing_checkbox.pack()
         self.should_attack_decay_smoothing_checkbox.state(['selected'])
+        self.limiter_checkbox = ttk.Checkbutton(self.frame_right, text="Master bus limiter", onvalue=True, offvalue=False, command=self.update_limiter)
+        self.limiter_checkbox.pack()
+        self.limiter_checkbox.state(['!alternate'])
         self.wave_type_label = tkinter.Label(self.frame_right, text="Wave type:")
         self.wave_type_label.pack()
         self.wave_type = tkinter.StringVar(self.root)
-        self.wave_type_sine_radiobutton = ttk.Radiobutton(self.frame_right, text="Sine wave", variable=self.wave_type, value="sine")
+        self.wave_type_sine_radiobutton = ttk.Radiobutton(self.frame_right, text="Sine wave", variable=self.wave_type, value="sine", command=self.update_wave_type)
         self.wave_type_sine_radiobutton.pack()
-        self.wave_type_square_radiobutton = ttk.Radiobutton(self.frame_right, text="Square wave", variable=self.wave_type, value="square")
+        self.wave_type_square_radiobutton = ttk.Radiobutton(self.frame_right, text="Square wave", variable=self.wave_type, value="square", command=self.update_wave_type)
         self.wave_type_square_radiobutton.pack()
+        self.wave_type_saw_radiobutton = ttk.Radiobutton(self.frame_right, text="Sawtooth wave", variable=self.wave_type, value="saw", command=self.update_wave_type)
+        self.wave_type_saw_radiobutton.pack()
+        self.wave_type_triangle_radiobutton = ttk.Radiobutton(self.frame_right, text="Triangle wave", variable=self.wave_type, value="triangle", command=self.update_wave_type)
+        self.wave_type_triangle_radiobutton.pack()
         self.wave_type.set("sine")
         self.wave_type_sine_radiobutton.invoke()
         self.reset_settings_button = ttk.Button(self.frame_right, text="Reset Settings", command=self.reset_settings)
@@ -197,6 +142,21 @@ class SynthInterface:
         self.record_status_label_var = tkinter.StringVar(self.root, "Not recording.")
         self.record_status_label = tkinter.Label(self.frame_right, textvariable=self.record_status_label_var)
         self.record_status_label.pack()
+        self.record_format_label = tkinter.Label(self.frame_right, text="Record format:")
+        self.record_format_label.pack()
+        self.record_format = tkinter.StringVar(self.root)
+        self.record_format_radiobuttons = []
+        for format, (description, _) in RECORD_FORMATS.items():
+            radiobutton = ttk.Radiobutton(self.frame_right, text=description, variable=self.record_format, value=format, command=self.update_record_format)
+            radiobutton.pack()
+            self.record_format_radiobuttons.append(radiobutton)
+        self.record_format.set("float32")
+        self.compression_level_label_var = tkinter.StringVar(self.root, "FLAC compression level: 5")
+        self.compression_level_label = tkinter.Label(self.frame_right, textvariable=self.compression_level_label_var)
+        self.compression_level_label.pack()
+        self.compression_level_slider = tkinter.Scale(self.frame_right, from_=0, to_=8, orient=tkinter.HORIZONTAL, command=self.update_compression_level)
+        self.compression_level_slider.pack()
+        self.compression_level_slider.set(5)
         self.start_record_midi_button = ttk.Button(self.frame_right, text="Record MIDI", command=self.start_record_midi)
         self.start_record_midi_button.pack()
         self.stop_record_midi_button = ttk.Button(self.frame_right, text="Stop", command=self.stop_record_midi)
@@ -221,9 +181,18 @@ class SynthInterface:
         self.synth_debug_label_var_5 = tkinter.StringVar(self.root, f"Output format: 32-bit float")
         self.synth_debug_label_5 = tkinter.Label(self.frame_debug, textvariable=self.synth_debug_label_var_5)
         self.synth_debug_label_5.pack()
-        self.synth_debug_label_var_5 = tkinter.StringVar(self.root, f"Record format: 32-bit int")
+        self.synth_debug_label_var_5 = tkinter.StringVar(self.root, f"Record format: {RECORD_FORMATS[self.record_format.get()][0]}")
         self.synth_debug_label_5 = tkinter.Label(self.frame_debug, textvariable=self.synth_debug_label_var_5)
         self.synth_debug_label_5.pack()
+        self.synth_debug_label_var_6 = tkinter.StringVar(self.root, "Underruns/overruns: [synth inactive]")
+        self.synth_debug_label_6 = tkinter.Label(self.frame_debug, textvariable=self.synth_debug_label_var_6)
+        self.synth_debug_label_6.pack()
+        self.synth_debug_label_var_7 = tkinter.StringVar(self.root, "Dropped record blocks: [not recording]")
+        self.synth_debug_label_7 = tkinter.Label(self.frame_debug, textvariable=self.synth_debug_label_var_7)
+        self.synth_debug_label_7.pack()
+        self.synth_debug_label_var_8 = tkinter.StringVar(self.root, "Gain reduction: [limiter off]")
+        self.synth_debug_label_8 = tkinter.Label(self.frame_debug, textvariable=self.synth_debug_label_var_8)
+        self.synth_debug_label_8.pack()
 
         self.frame_left.pack(expand=True, fill=tkinter.BOTH, side=tkinter.LEFT)
         self.frame_center.pack(expand=True, fill=tkinter.BOTH, side=tkinter.LEFT)
@@ -256,29 +225,59 @@ class SynthInterface:
 
     def update_tuning_type(self):
         if self.tuning_type.get() == 'et':
-            self.calculate_pitch = calculate_pitch_et
+            self.engine.calculate_pitch = calculate_pitch_et
             self.tuning_slider.config(state='normal')
         elif self.tuning_type.get() == 'young':
-            self.calculate_pitch = calculate_pitch_young
+            self.engine.calculate_pitch = calculate_pitch_young
             self.tuning_slider.config(state='disabled')
         elif self.tuning_type.get() == 'werckmeister':
-            self.calculate_pitch = calculate_pitch_werckmeister
+            self.engine.calculate_pitch = calculate_pitch_werckmeister
+            self.tuning_slider.config(state='disabled')
+        elif self.tuning_type.get() == 'scala':
+            if self.scala_tuning is None:
+                self.load_scala_tuning()
+                return
+            self.engine.calculate_pitch = self.scala_tuning
             self.tuning_slider.config(state='disabled')
+
+    def load_scala_tuning(self):
+        scl_file = filedialog.askopenfilename(filetypes=(('Scala Scale', '*.scl'), ('All Files', '*.*')))
+        if not scl_file:
+            if self.scala_tuning is None:
+                self.tuning_type.set("et")
+                self.update_tuning_type()
+            return
+        # The keyboard mapping is optional; cancel to map the scale linearly from middle C.
+        kbm_file = filedialog.askopenfilename(title="Keyboard mapping (optional)", filetypes=(('Scala Keyboard Mapping', '*.kbm'), ('All Files', '*.*')))
+        try:
+            self.scala_tuning = scala_tuning(scl_file, kbm_file or None)
+        except (OSError, ValueError, IndexError) as e:
+            tkinter.messagebox.showerror(self.title, f"Failed to load the Scala tuning: {e}")
+            return
+        self.scala_label_var.set(f"Scala tuning: {os.path.basename(scl_file)}" + (f" ({os.path.basename(kbm_file)})" if kbm_file else ""))
+        self.tuning_type.set("scala")
+        self.update_tuning_type()
     
     def update_volume(self, _):
-        self.volume = self.volume_slider.get()
-        self.volume_label_var.set(f"Volume: {self.volume}%")
+        self.engine.volume = self.volume_slider.get()
+        self.volume_label_var.set(f"Volume: {self.engine.volume}%")
 
     def update_et(self, _):
-        self.et = self.tuning_slider.get()
-        self.tuning_label_var.set(f"Even-tempered tuning system: {self.et}-et")
+        self.engine.et = self.tuning_slider.get()
+        self.tuning_label_var.set(f"Even-tempered tuning system: {self.engine.et}-et")
     
     def update_hertz(self, _):
-        self.hertz = self.hertz_slider.get()
-        self.hertz_label_var.set(f"Re-tune: {self.hertz}hz")
+        self.engine.hertz = self.hertz_slider.get()
+        self.hertz_label_var.set(f"Re-tune: {self.engine.hertz}hz")
 
     def update_should_attack_decay_smoothing(self):
-        self.should_attack_decay_smoothing = 'selected' in self.should_attack_decay_smoothing_checkbox.state()
+        self.engine.should_attack_decay_smoothing = 'selected' in self.should_attack_decay_smoothing_checkbox.state()
+
+    def update_limiter(self):
+        self.engine.compressor = Compressor.limiter(SAMPLE_RATE) if 'selected' in self.limiter_checkbox.state() else None
+
+    def update_wave_type(self):
+        self.engine.wave_type = self.wave_type.get()
     
     def reset_settings(self):
         self.volume_slider.set(100)
@@ -290,6 +289,7 @@ class SynthInterface:
         self.should_attack_decay_smoothing_checkbox.state(['selected'])
         self.update_should_attack_decay_smoothing()
         self.wave_type.set('sine')
+        self.update_wave_type()
 
     def select_midi_input(self):
         selected = self.midi_inputs_listbox.curselection()
@@ -323,127 +323,108 @@ class SynthInterface:
 
         # Init sound.
         self.synth_status_label_var.set("Initializing sound...")
-        self.audio = pyaudio.PyAudio()
-        self.stream = self.audio.open(format=pyaudio.paFloat32,
-                        channels=1,
-                        rate=SAMPLE_RATE,
-                        output=True)
-
-        # Init sound generation vars.
-        self.synth_status_label_var.set("Initializing...")
-        self.num_frames_count = 0
-        self.current_notes = []
-        self.base = np.arange(int(SAMPLE_RATE * TIMEOUT / 1000))
-        self.buffer = np.zeros(int(SAMPLE_RATE * TIMEOUT / 1000))
-        self.attack_smoothing = self.base / len(self.base)
-        self.decay_smoothing = (TIMEOUT / 1000 - self.base / SAMPLE_RATE) / (TIMEOUT / 1000)
+        if self.use_callback_output:
+            self.output = CallbackOutput(self.engine.render, self.engine.block_size, PyAudioBackend(SAMPLE_RATE, self.engine.block_size))
+        else:
+            self.output = None
+            self.audio = pyaudio.PyAudio()
+            self.stream = self.audio.open(format=pyaudio.paFloat32,
+                            channels=1,
+                            rate=SAMPLE_RATE,
+                            output=True)
 
         self.running = True
-        
+
         # Start the sound generation loop.
         self.synth_status_label_var.set("Starting sound play thread...")
-        threading.Thread(target=lambda: self.sound_play_thread()).start()
+        if self.output:
+            self.engine.reset()
+            self.output.start()
+        else:
+            self.engine.start(self.stream)
 
-        # Start the MIDI loop.
-        self.synth_status_label_var.set("Starting MIDI input thread...")
-        threading.Thread(target=lambda: self.midi_input_thread()).start()
+        # Start receiving MIDI.
+        self.synth_status_label_var.set("Starting MIDI input...")
+        self.midi.setCallback(make_midi_callback(self.engine.events))
 
         self.synth_status_label_var.set("Synth started.")
-        self.synth_debug_label_var_3.set(f"Num notes: {len(self.current_notes)}")
-        self.synth_debug_label_var_4.set(f"Num frames: {self.num_frames_count}")
+        self.update_synth_debug_labels()
         self.start_synth_button.state(['disabled'])
         self.stop_synth_button['state'] = tkinter.NORMAL
 
-    def sound_play_thread(self):
-        self.sound_thread_running = True
-        while self.running:
-            # Zero the buffer and calculate the sounds.
-            self.buffer -= self.buffer
-            for note in self.current_notes[:]:
-                pitch = self.calculate_pitch(note.pitch, self.et) + self.hertz
-                sound = np.sin(2 * np.pi * (self.base + self.num_frames_count * int(SAMPLE_RATE * TIMEOUT / 1000)) * pitch / SAMPLE_RATE)
-                if self.wave_type.get() == 'square':
-                    sound = np.sign(sound)
-                sound = note.velocity / 400 * sound * (self.volume / 100)
-                if note.is_new:
-                    # Apply attack smoothing.
-                    if self.should_attack_decay_smoothing:
-                        sound *= self.attack_smoothing
-                    note.is_new = False
-                if note.should_remove:
-                    # Apply decay smoothing and delete the note.
-                    if self.should_attack_decay_smoothing:
-                        sound *= self.decay_smoothing
-                    del self.current_notes[self.find_note_by_number(note.pitch)]
-                self.buffer += sound
-
-            self.num_frames_count += 1
-            if len(self.current_notes) == 0:
-                self.num_frames_count = 0
-
-            # Write the sound to the output buffer.
-            data = self.buffer.astype(np.float32).tobytes()
-            self.stream.write(data)
-            if self.record:
-                self.record.writeframes((self.buffer / 1.414 * 2147483647).astype(np.int32).tobytes())
-            
-            self.synth_debug_label_var_3.set(f"Num notes: {len(self.current_notes)}")
-            self.synth_debug_label_var_4.set(f"Num frames: {self.num_frames_count}")
-        
-        self.synth_debug_label_var_3.set("Num notes: [synth inactive]")
-        self.synth_debug_label_var_4.set("Num frames: [synth inactive]")
-
-    def find_note_by_number(self, num):
-        for i, note in enumerate(self.current_notes):
-            if note.pitch == num:
-                return i
-
-    def midi_input_thread(self):
-        while self.running:
-            message = self.midi.getMessage(0)
-            if not message:
-                continue
-
-            # Process the message.
-            if message.isNoteOn():
-                note = Note(message.getNoteNumber(), message.getVelocity(), True, False)
-                self.current_notes.append(note)
-                if self.record_midi:
-                    self.record_midi.note_on(note)
-            elif message.isNoteOff():
-                self.current_notes[self.find_note_by_number(message.getNoteNumber())].should_remove = True
-                if self.record_midi:
-                    self.record_midi.note_off(message.getNoteNumber())
+    def update_synth_debug_labels(self):
+        # Poll the engine from the Tk thread, rather than setting Tk variables from the audio thread.
+        if not self.running:
+            self.synth_debug_label_var_3.set("Num notes: [synth inactive]")
+            self.synth_debug_label_var_4.set("Num frames: [synth inactive]")
+            self.synth_debug_label_var_6.set("Underruns/overruns: [synth inactive]")
+            return
+        self.synth_debug_label_var_3.set(f"Num notes: {self.engine.voices.count()}")
+        self.synth_debug_label_var_4.set(f"Num frames: {self.engine.num_frames_count}")
+        if self.output:
+            self.synth_debug_label_var_6.set(f"Underruns/overruns: {self.output.underruns}/{self.output.overruns}")
+        else:
+            self.synth_debug_label_var_6.set("Underruns/overruns: [blocking output]")
+        record = self.record
+        if record:
+            self.synth_debug_label_var_7.set(f"Dropped record blocks: {record.dropped_blocks}/{record.blocks_written + record.dropped_blocks}")
+        else:
+            self.synth_debug_label_var_7.set("Dropped record blocks: [not recording]")
+        compressor = self.engine.compressor
+        if compressor:
+            self.synth_debug_label_var_8.set(f"Gain reduction: {compressor.gain_reduction_db:.1f}dB")
+        else:
+            self.synth_debug_label_var_8.set("Gain reduction: [limiter off]")
+        self.root.after(TIMEOUT, self.update_synth_debug_labels)
 
     def stop_synth(self):
         if self.running == False:
             return
         self.running = False
-        self.stream.stop_stream()
-        self.stream.close()
-        self.audio.terminate()
+        if self.output:
+            self.output.stop()
+        else:
+            self.engine.stop()
+            self.stream.stop_stream()
+            self.stream.close()
+            self.audio.terminate()
         self.midi.closePort()
         self.midi.cancelCallback()
         self.synth_status_label_var.set("Synth stopped.")
         self.start_synth_button['state'] = tkinter.NORMAL
         self.stop_synth_button.state(['disabled'])
 
+    def update_record_format(self):
+        self.synth_debug_label_var_5.set(f"Record format: {RECORD_FORMATS[self.record_format.get()][0]}")
+
+    def update_compression_level(self, level):
+        self.compression_level = int(level)
+        self.compression_level_label_var.set(f"FLAC compression level: {self.compression_level}")
+
     def start_record(self):
         if not self.running:
             tkinter.messagebox.showerror(self.title, "Please start the synth to record.")
             return
-        
-        file = tempfile.NamedTemporaryFile('wb', delete=False)
-        wf = wave.open(file, 'wb')
-        wf.setnchannels(1)
-        wf.setsampwidth(self.audio.get_sample_size(pyaudio.paInt32))
-        wf.setframerate(SAMPLE_RATE)
-        self.record = wf
-        self.record_file = file
+
+        # Ask where to save first, so the recording can be written straight into place.
+        format = self.record_format.get()
+        extension = RECORD_FORMATS[format][1]
+        if extension == 'flac':
+            filetypes = (('FLAC Audio File', '*.flac'), ('All Files', '*.*'))
+        else:
+            filetypes = (('Waveform Audio File', '*.wav'), ('All Files', '*.*'))
+        file = filedialog.asksaveasfilename(confirmoverwrite=True, filetypes=filetypes, defaultextension=extension)
+        if not file:
+            return
+        self.record = make_recorder(file, SAMPLE_RATE, format, self.engine.block_size, self.compression_level)
+        self.engine.add_recorder(self.record)
         
         self.record_status_label_var.set("Recording...")
         self.start_record_button.state(['disabled'])
         self.stop_record_button['state'] = tkinter.NORMAL
+        for radiobutton in self.record_format_radiobuttons:
+            radiobutton.state(['disabled'])
+        self.compression_level_slider['state'] = tkinter.DISABLED
 
     def stop_record(self):
         if not self.record:
@@ -451,29 +432,31 @@ class SynthInterface:
         
         wf = self.record
         self.record = None
-        wf.close()
-        self.record_file.close()
+        self.engine.remove_recorder(wf, wait=True)
+        try:
+            wf.close()
+        except OSError as e:
+            tkinter.messagebox.showerror(self.title, f"Failed to write the recording: {e}")
 
-        self.record_status_label_var.set("Not recording.")
+        self.record_status_label_var.set("Not recording." if not wf.dropped_blocks else f"Not recording. {wf.dropped_blocks} blocks were dropped.")
         self.stop_record_button.state(['disabled'])
         self.start_record_button['state'] = tkinter.NORMAL
-
-        filetypes = (('Waveform Audio File', '*.wav'), ('All Files', '*.*'))
-        file = filedialog.asksaveasfilename(confirmoverwrite=True, filetypes=filetypes, defaultextension='wav')
-        if not file:
-            return
-        shutil.copyfile(self.record_file.name, file)
-        os.remove(self.record_file.name)
+        for radiobutton in self.record_format_radiobuttons:
+            radiobutton.state(['!disabled'])
+        self.compression_level_slider['state'] = tkinter.NORMAL
 
     def start_record_midi(self):
         if not self.running:
             tkinter.messagebox.showerror(self.title, "Please start the synth to record MIDI.")
             return
-        
-        file = tempfile.NamedTemporaryFile('wb', delete=False)
-        midi = MIDIRecordContext(file)
-        self.record_midi = midi
-        self.record_midi_file = file
+
+        # Ask where to save first, so the events can be streamed straight to the file.
+        filetypes = (('MIDI File', '*.mid'), ('All Files', '*.*'))
+        file = filedialog.asksaveasfilename(confirmoverwrite=True, filetypes=filetypes, defaultextension='mid')
+        if not file:
+            return
+        self.record_midi = SMFRecorder(file, SAMPLE_RATE)
+        self.engine.add_recorder(self.record_midi)
 
         self.midi_record_status_label_var.set("Recording...")
         self.start_record_midi_button.state(['disabled'])
@@ -485,18 +468,15 @@ class SynthInterface:
         
         midi = self.record_midi
         self.record_midi = None
-        midi.close()
-        self.record_midi_file.close()
+        self.engine.remove_recorder(midi, wait=True)
+        try:
+            midi.close()
+        except OSError as e:
+            tkinter.messagebox.showerror(self.title, f"Failed to write the MIDI recording: {e}")
 
         self.midi_record_status_label_var.set("Not recording.")
         self.stop_record_midi_button.state(['disabled'])
         self.start_record_midi_button['state'] = tkinter.NORMAL
-        filetypes = (('MIDI File', '*.mid'), ('All Files', '*.*'))
-        file = filedialog.asksaveasfilename(confirmoverwrite=True, filetypes=filetypes, defaultextension='mid')
-        if not file:
-            return
-        shutil.copyfile(self.record_midi_file.name, file)
-        os.remove(self.record_midi_file.name)
 
 if __name__ == '__main__':
     s = SynthInterface()
@@ -0,0 +1,239 @@
+import collections
+import os
+import queue
+import struct
+import threading
+import warnings
+import numpy as np
+from scipy.io import wavfile
+import stft
+
+BLOCK_FRAMES = 256
+MAX_BLOCKS = 64
+PREFETCH_BLOCKS = 2
+# Blocks with fewer than 1 / SPARSE_FRACTION of their frames asked for (and not cached) aren't computed whole; only
+# the frames that are asked for are.
+SPARSE_FRACTION = 8
+# Roughly how much memory Int24Samples may use for gather indices at once.
+GATHER_BYTES = 1 << 20
+
+class Int24Samples:
+    # The samples of a memory-mapped 24-bit PCM data chunk, decoded to int32 only as they are indexed, so a long
+    # recording is never read whole. Like scipy's wavfile.read, samples are scaled up to fill the int32 range, and are
+    # (frames,) for mono and (frames, channels) otherwise. Supports slicing and indexing with integer arrays along the
+    # first axis.
+    dtype = np.dtype(np.int32)
+
+    def __init__(self, data: np.array, channels: int):
+        self.data = data
+        self.channels = channels
+        self.frames = len(data) // (3 * channels)
+
+    def __len__(self) -> int:
+        return self.frames
+
+    @property
+    def ndim(self) -> int:
+        return 1 if self.channels == 1 else 2
+
+    @property
+    def shape(self) -> tuple:
+        return (self.frames,) if self.channels == 1 else (self.frames, self.channels)
+
+    def __getitem__(self, key) -> np.array:
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.frames)
+            if step == 1:
+                raw = self.data[start * 3 * self.channels:max(stop, start) * 3 * self.channels].reshape(-1, self.channels, 3)
+                return self.decode(raw).reshape((-1,) + self.shape[1:])
+            key = np.arange(start, stop, step)
+        # Gather the three bytes of every channel of every frame asked for, a chunk of frames at a time so the byte
+        # indices stay small.
+        key = np.asarray(key)
+        frames = key.ravel()
+        offsets = np.arange(self.channels)[:, None] * 3 + np.arange(3)
+        out = np.empty((len(frames), self.channels), dtype=self.dtype)
+        chunk = max(GATHER_BYTES // (offsets.size * 8), 1)
+        for i in range(0, len(frames), chunk):
+            out[i:i + chunk] = self.decode(self.data[frames[i:i + chunk, None, None] * offsets.size + offsets])
+        return out.reshape(key.shape + self.shape[1:])
+
+    def decode(self, raw: np.array) -> np.array:
+        # raw is (..., channels, 3) little-endian bytes; put them in the top three bytes of each int32, giving
+        # (..., channels) samples.
+        wide = np.zeros(raw.shape[:-1] + (4,), dtype=np.uint8)
+        wide[..., 1:] = raw
+        return wide.view('<i4')[..., 0]
+
+def map_wav_int24(file: str) -> tuple:
+    # Memory-map the data chunk of a 24-bit PCM WAV file. Returns (rate, Int24Samples), or None for any other format.
+    with open(file, 'rb') as f:
+        if f.read(4) != b'RIFF' or f.read(8)[4:] != b'WAVE':
+            return None
+        format = None
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                return None
+            chunk, size = header[:4], struct.unpack('<I', header[4:])[0]
+            if chunk == b'fmt ':
+                format = struct.unpack('<HHIIHH', f.read(16))
+                f.seek(size - 16 + size % 2, 1)
+            elif chunk == b'data':
+                offset = f.tell()
+                break
+            else:
+                f.seek(size + size % 2, 1)
+    if format is None:
+        return None
+    tag, channels, rate, _, _, bits = format
+    # 0xfffe is WAVE_FORMAT_EXTENSIBLE, which 24-bit files are often written as.
+    if tag not in (1, 0xfffe) or bits != 24:
+        return None
+    size = min(size, os.path.getsize(file) - offset)
+    size -= size % (3 * channels)
+    return rate, Int24Samples(np.memmap(file, np.uint8, 'r', offset, (size,)), channels)
+
+def read_wav_mmap(file: str) -> tuple:
+    # Memory-map the samples of file, so only the parts that are looked at are ever read. 24-bit PCM, which scipy
+    # can't map, is mapped as raw bytes and decoded as it is read. Anything else scipy can't map is read into memory.
+    try:
+        return wavfile.read(file, mmap=True)
+    except ValueError:
+        mapped = map_wav_int24(file)
+        if mapped is not None:
+            return mapped
+        warnings.warn(f"{file} can't be memory-mapped, so it is read into memory instead")
+        return wavfile.read(file)
+
+class LazySpectrogram:
+    # A uint8 spectrogram of a (usually memory-mapped) recording that is computed BLOCK_FRAMES frames at a time,
+    # only when the frames are asked for. The last max_blocks blocks are cached, and the neighbours of every block
+    # that is asked for are computed ahead of time on a background thread. Zoomed out views ask for a few frames
+    # spread over many blocks; those frames are computed on their own, so the cost of a view depends on how many
+    # columns it has rather than on how much of the file it covers.
+    # Since the loudest bin of the whole file isn't known, values are scaled to a full-scale sine wave instead.
+
+    def __init__(self, samples: np.array, width: int = 1024, hop: int = None, window: str = 'hann', db: bool = False, floor_db: float = -80, kernel=None, block_frames: int = BLOCK_FRAMES, max_blocks: int = MAX_BLOCKS, prefetch: int = PREFETCH_BLOCKS):
+        self.samples = samples
+        self.width = width
+        self.hop = hop or width
+        self.window = window
+        self.db = db
+        self.floor_db = floor_db
+        self.kernel = kernel
+        self.block_frames = block_frames
+        self.max_blocks = max_blocks
+        self.prefetch = prefetch
+        self.ref = stft.full_scale(samples, width, window)
+        self.num_frames = max((len(samples) - width) // self.hop + 1, 0)
+        self.num_bins = width // 2 + 1 if kernel is None else kernel.shape[1]
+        self.num_blocks = -(-self.num_frames // block_frames)
+
+        # Computed blocks, least recently used first.
+        self.blocks = collections.OrderedDict()
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.num_computed = 0
+        self.num_prefetched = 0
+        self.prefetch_thread = threading.Thread(target=self.prefetch_loop, daemon=True)
+        self.prefetch_thread.start()
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    @property
+    def shape(self) -> tuple:
+        return (self.num_frames, self.num_bins)
+
+    def compute_block(self, index: int) -> np.array:
+        start = index * self.block_frames * self.hop
+        end = min((index + 1) * self.block_frames, self.num_frames) * self.hop + self.width - self.hop
+        return stft.spectrogram(self.samples[start:end], self.width, self.hop, self.window, self.db, self.floor_db, self.ref, self.kernel)
+
+    def compute_frames(self, indices: np.array) -> np.array:
+        # The frames at indices, read straight from the samples without computing the blocks around them.
+        positions = indices[:, None] * self.hop + np.arange(self.width)
+        frames = self.samples[positions]
+        if frames.ndim > 2:
+            frames = frames.mean(axis=2)
+        return stft.scale_magnitudes(stft.transform_frames(frames, self.window), self.db, self.floor_db, self.ref, self.kernel)
+
+    def store_block(self, index: int, block: np.array):
+        with self.lock:
+            self.blocks[index] = block
+            self.num_computed += 1
+            while len(self.blocks) > self.max_blocks:
+                self.blocks.popitem(last=False)
+
+    def get_block(self, index: int) -> np.array:
+        with self.lock:
+            block = self.blocks.get(index)
+            if block is not None:
+                self.blocks.move_to_end(index)
+                return block
+        block = self.compute_block(index)
+        self.store_block(index, block)
+        return block
+
+    def prefetch_loop(self):
+        while True:
+            index = self.requests.get()
+            if index is None:
+                return
+            with self.lock:
+                cached = index in self.blocks
+            if not cached:
+                self.store_block(index, self.compute_block(index))
+                self.num_prefetched += 1
+
+    def request_neighbours(self, first: int, last: int):
+        # Queue the blocks on either side of first..last, nearest first, so panning in either direction finds them
+        # ready.
+        if not self.requests.empty():
+            return
+        for distance in range(1, self.prefetch + 1):
+            for index in (last + distance, first - distance):
+                if 0 <= index < self.num_blocks:
+                    self.requests.put(index)
+
+    def take(self, indices: np.array, axis: int = 0) -> np.array:
+        # The frames at indices, as a (len(indices), num_bins) array, like ndarray.take along the first axis.
+        assert axis == 0
+        indices = np.asarray(indices)
+        out = np.zeros((len(indices), self.num_bins), dtype=np.uint8)
+        blocks = indices // self.block_frames
+        used, inverse, counts = np.unique(blocks, return_inverse=True, return_counts=True)
+        with self.lock:
+            dense = (counts * SPARSE_FRACTION >= self.block_frames) | np.isin(used, list(self.blocks))
+        for i in np.flatnonzero(dense).tolist():
+            index = int(used[i])
+            mask = inverse == i
+            out[mask] = self.get_block(index)[indices[mask] - index * self.block_frames]
+        sparse = ~dense[inverse]
+        if sparse.any():
+            out[sparse] = self.compute_frames(indices[sparse])
+        if dense.any():
+            self.request_neighbours(int(used[dense].min()), int(used[dense].max()))
+        return out
+
+    def close(self):
+        self.requests.put(None)
+        self.prefetch_thread.join()
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    rate, samples = read_wav_mmap(sys.argv[1] if len(sys.argv) > 1 else "Recording (2).wav")
+    data = LazySpectrogram(samples, 1024, 256, db=True, block_frames=64)
+    print(f"{len(samples) / rate:.1f}s recording, {len(data)} frames in {data.num_blocks} blocks")
+    # The whole file across 800 columns, as spectro.py opens it, then zoomed in to the start.
+    overview = np.linspace(0, len(data) - 1, 800).astype(np.intp)
+    for name, columns in [('overview', overview), ('cold', np.arange(0, 128)), ('cached', np.arange(0, 128)), ('next', np.arange(128, 256))]:
+        if name == 'next':
+            time.sleep(0.5)
+        start_time = time.perf_counter()
+        data.take(columns)
+        print(f"{name}: {(time.perf_counter() - start_time) * 1000:.2f}ms, {data.num_computed} blocks computed, {data.num_prefetched} prefetched")
+    data.close()
@@ -1,9 +1,10 @@
 import rtmidi
 import sys
 import pyaudio
-import numpy as np
-import threading
-from dataclasses import dataclass
+import time
+from engine import SynthEngine
+from midi_input import make_midi_callback
+from tuning import calculate_pitch_et
 
 SAMPLE_RATE = 44100
 PORT = 0
@@ -11,11 +12,6 @@ TIMEOUT = 100
 
 print("-- hello tim this is kevins little synthesizer --")
 
-@dataclass
-class Note:
-    pitch: int
-    velocity: int
-
 print("initializing audio...")
 audio = pyaudio.PyAudio()
 stream = audio.open(format=pyaudio.paFloat32,
@@ -41,64 +37,28 @@ PORT = int(selected_port)
 print(f"opening midi port {PORT}: {midi.getPortName(PORT)}...")
 midi.openPort(PORT)
 
-num_frames_count = 0
-
-current_notes = []
-base = np.arange(int(SAMPLE_RATE * TIMEOUT / 1000))
-buffer = np.zeros(int(SAMPLE_RATE * TIMEOUT / 1000))
-
-def calculate_pitch_12et(pitch):
-    return pow(2, (pitch - 69) / 12) * 440
-def calculate_pitch_24et(pitch):
-    return pow(2, (pitch - 69) / 24) * 440
-
-calculate_pitch = calculate_pitch_24et
-
-def sound_play_thread():
-    global current_notes, stream, buffer, num_frames_count
-
-    try:
-        while True:
-            buffer -= buffer
-            for note in current_notes:
-                pitch = calculate_pitch(note.pitch)
-                buffer += note.velocity / 1000 * (np.sin(2 * np.pi * (base + num_frames_count * int(SAMPLE_RATE * TIMEOUT / 1000)) * pitch / SAMPLE_RATE))
-            num_frames_count += 1
-            # play the sounds
-            stream.write(buffer.astype(np.float32).tobytes())
-
-    except KeyboardInterrupt:
-        print("ctrl-c, exiting")
+# 24-et, no smoothing, velocity / 1000
+engine = SynthEngine(SAMPLE_RATE, TIMEOUT)
+engine.calculate_pitch = calculate_pitch_et
+engine.et = 24
+engine.volume = 40
+engine.should_attack_decay_smoothing = False
 
 print("initializing sound play thread...")
-threading.Thread(target=sound_play_thread).start()
+engine.start(stream)
 
-def find_note_by_number(num):
-    global current_notes
-    for i, note in enumerate(current_notes):
-        if note.pitch == num:
-            return i
-
-print("initializing midi input thread...")
+print("initializing midi input...")
+midi.setCallback(make_midi_callback(engine.events))
 try:
     print("ready!! (press ctrl-c or close the window to exit)")
     while True:
-        message = midi.getMessage(0)
-        if not message:
-            continue
-
-        # process the message
-        if message.isNoteOn():
-            note = Note(message.getNoteNumber(), message.getVelocity())
-            current_notes.append(note)
-        elif message.isNoteOff():
-            del current_notes[find_note_by_number(message.getNoteNumber())]
-        if len(current_notes) == 0:
-            num_frames_count = 0
+        time.sleep(1)
 
 except KeyboardInterrupt:
     print("ctrl-c, exiting")
 
+midi.cancelCallback()
+engine.stop()
 stream.stop_stream()
 stream.close()
 audio.terminate()
@@ -0,0 +1,195 @@
+import threading
+import time
+import numpy as np
+import pygame
+from audio_output import RingBuffer
+import logfreq
+import stft
+
+SAMPLE_RATE = 44100
+CHUNK = 1024
+
+class StreamingSTFT:
+    # Computes STFT frames as audio arrives. Chunks are pushed into a ring buffer (from the audio thread), and
+    # process turns every complete frame in it into a column, hop samples apart, keeping the overlap for next time.
+    def __init__(self, width: int = 2048, hop: int = 512, window: str = 'hann', kernel=None, capacity: int = 1 << 17):
+        self.width = width
+        self.hop = hop
+        self.window = window
+        self.kernel = kernel
+        self.ring = RingBuffer(capacity)
+        self.frames = np.zeros(capacity, dtype=np.float32)
+        self.num_bins = width // 2 + 1 if kernel is None else kernel.shape[1]
+
+    @property
+    def overruns(self) -> int:
+        return self.ring.overruns
+
+    def push(self, chunk: np.array) -> bool:
+        return self.ring.write(chunk)
+
+    def process(self) -> np.array:
+        # The magnitudes of every frame that can be completed, as a (frames, num_bins) array.
+        available = self.ring.available()
+        if available < self.width:
+            return np.zeros((0, self.num_bins), dtype=np.float32)
+        count = (available - self.width) // self.hop + 1
+        samples = self.frames[:(count - 1) * self.hop + self.width]
+        self.ring.peek(samples)
+        self.ring.skip(count * self.hop)
+        magnitudes = stft.stft(samples, self.width, self.hop, self.window)
+        if self.kernel is not None:
+            magnitudes = np.asarray(magnitudes @ self.kernel, dtype=np.float32)
+        return magnitudes
+
+class PyAudioInput:
+    # Records from the default input device through PyAudio in callback mode, handing every chunk to callback.
+    def __init__(self, sample_rate: int, frames_per_buffer: int):
+        self.sample_rate = sample_rate
+        self.frames_per_buffer = frames_per_buffer
+
+    def open(self, callback):
+        import pyaudio
+        def stream_callback(in_data, frame_count, time_info, status):
+            callback(np.frombuffer(in_data, dtype=np.float32))
+            return (None, pyaudio.paContinue)
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(format=pyaudio.paFloat32,
+                        channels=1,
+                        rate=self.sample_rate,
+                        frames_per_buffer=self.frames_per_buffer,
+                        input=True,
+                        stream_callback=stream_callback)
+        self.stream.start_stream()
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
+
+class WavInput:
+    # Plays a WAV file into callback chunk by chunk, at the pace a sound card would, so the live view can be tried
+    # without a microphone.
+    def __init__(self, file: str, frames_per_buffer: int):
+        from scipy.io import wavfile
+        self.sample_rate, samples = wavfile.read(file)
+        samples = stft.to_mono(samples)
+        if np.issubdtype(samples.dtype, np.integer):
+            samples = samples / float(np.iinfo(samples.dtype).max)
+        self.samples = samples.astype(np.float32)
+        self.frames_per_buffer = frames_per_buffer
+        self.running = False
+        self.thread = None
+
+    def run(self, callback):
+        start_time = time.perf_counter()
+        for i, pos in enumerate(range(0, len(self.samples), self.frames_per_buffer)):
+            if not self.running:
+                return
+            callback(self.samples[pos:pos + self.frames_per_buffer])
+            delay = start_time + (i + 1) * self.frames_per_buffer / self.sample_rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def open(self, callback):
+        self.running = True
+        self.thread = threading.Thread(target=self.run, args=(callback,), daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+class LiveSpectrogram:
+    # A scrolling spectrogram of the input: each new column is drawn at the right edge and the rest of the screen is
+    # scrolled left, so the cost per frame only depends on the number of new columns.
+    def __init__(self, source, sample_rate: int = SAMPLE_RATE, width: int = 2048, hop: int = 512, log: bool = False, tuning: str = 'et', et: int = 12, hertz: float = 0, floor_db: float = -80):
+        self.source = source
+        self.sample_rate = sample_rate
+        self.floor_db = floor_db
+        kernel = None
+        if log:
+            kernel = logfreq.make_kernel(logfreq.tuning_freqs(tuning, et, hertz, sample_rate), width, sample_rate)
+        self.stft = StreamingSTFT(width, hop, kernel=kernel)
+        # Input samples are floats from -1 to 1.
+        self.ref = stft.full_scale(np.zeros(0, dtype=np.float32), width)
+
+        pygame.init()
+        pygame.display.set_caption("Live spectrogram")
+        self.dims = [800, 500]
+        self.screen = pygame.display.set_mode(self.dims)
+        self.clock = pygame.time.Clock()
+        # The bin drawn on every row of the screen, top row first.
+        self.rows = (np.arange(self.dims[1])[::-1] * self.stft.num_bins / self.dims[1]).astype(np.int64)
+
+        self.num_chunks = 0
+        self.process_time = 0
+        self.max_process_time = 0
+        self.running = False
+
+    def on_chunk(self, chunk: np.array):
+        # Runs on the audio thread: only copy the chunk into the ring buffer.
+        self.stft.push(chunk)
+        self.num_chunks += 1
+
+    def draw_columns(self, magnitudes: np.array):
+        values = stft.quantize(stft.to_db(magnitudes[-self.dims[0]:], self.floor_db, self.ref), self.floor_db, 0)[:, self.rows]
+        pixels = np.zeros((len(values), self.dims[1], 3), dtype=np.uint8)
+        pixels[:, :, 1] = values
+        pixels[:, :, 2] = values
+        self.screen.scroll(-len(values), 0)
+        self.screen.blit(pygame.surfarray.make_surface(pixels), (self.dims[0] - len(values), 0))
+
+    def update(self) -> int:
+        # Turn everything that has arrived since the last update into columns. Returns the number of columns.
+        start_time = time.perf_counter()
+        magnitudes = self.stft.process()
+        if len(magnitudes):
+            self.draw_columns(magnitudes)
+        elapsed = time.perf_counter() - start_time
+        self.process_time += elapsed
+        self.max_process_time = max(self.max_process_time, elapsed)
+        return len(magnitudes)
+
+    def report(self, chunk: int) -> str:
+        per_chunk = self.process_time / max(self.num_chunks, 1) * 1000
+        budget = chunk / self.sample_rate * 1000
+        return f"{per_chunk:.3f}ms per {chunk}-sample chunk (budget {budget:.1f}ms), worst update {self.max_process_time * 1000:.2f}ms, {self.stft.overruns} overruns"
+
+    def run(self, chunk: int = CHUNK):
+        self.running = True
+        self.source.open(self.on_chunk)
+        last_report = time.perf_counter()
+        try:
+            while self.running:
+                for event in pygame.event.get():
+                    if event.type == pygame.QUIT:
+                        self.running = False
+                self.update()
+                pygame.display.flip()
+                self.clock.tick(60)
+                if time.perf_counter() - last_report >= 1:
+                    last_report = time.perf_counter()
+                    report = self.report(chunk)
+                    pygame.display.set_caption(f"Live spectrogram - {report}")
+                    print(report)
+        finally:
+            self.source.close()
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Show a live, scrolling spectrogram of the microphone.")
+    parser.add_argument('--file', default=None, help="play this WAV file in real time instead of recording")
+    parser.add_argument('--fft-width', type=int, default=2048)
+    parser.add_argument('--hop', type=int, default=512)
+    parser.add_argument('--log', action='store_true', help="show one bin per pitch of the tuning instead of linear frequency")
+    parser.add_argument('--tuning', default='et', help="tuning system for --log: et, young, werckmeister, or a Scala file as scale.scl or scale.scl,mapping.kbm")
+    parser.add_argument('--et', type=int, default=12, help="number of divisions of the octave for the even-tempered tuning")
+    parser.add_argument('--hertz', type=float, default=0, help="re-tune every pitch by this many hertz")
+    args = parser.parse_args()
+
+    source = PyAudioInput(SAMPLE_RATE, CHUNK) if args.file is None else WavInput(args.file, CHUNK)
+    app = LiveSpectrogram(source, source.sample_rate, args.fft_width, args.hop, args.log, args.tuning, args.et, args.hertz)
+    app.run()
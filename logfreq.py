@@ -0,0 +1,61 @@
+import numpy as np
+from scipy import sparse
+from tuning import compile_table, get_tuning
+import stft
+
+def tuning_freqs(tuning: str = 'et', et: int = 12, hertz: float = 0, rate: int = None) -> np.array:
+    # The frequencies the synth plays its pitches at with this tuning, in ascending order, leaving out the ones at or
+    # above the Nyquist frequency of rate.
+    freqs = np.sort(compile_table(get_tuning(tuning), et, hertz))
+    if rate is not None:
+        freqs = freqs[(freqs > 0) & (freqs < rate / 2)]
+    return freqs
+
+def make_kernel(freqs: np.array, width: int, rate: int) -> sparse.csr_matrix:
+    # A sparse (width // 2 + 1, len(freqs)) matrix that maps the magnitudes of an FFT of width samples onto
+    # log-frequency bins centered on freqs (ascending). Each bin is a triangle in log-frequency reaching out to its
+    # neighbours, widened to at least one FFT bin either side for low notes that fall between FFT bins. Columns sum
+    # to 1, so a bin is the weighted mean of the FFT magnitudes under it.
+    fft_freqs = stft.stft_freqs(width, rate)
+    log_fft = np.log2(np.maximum(fft_freqs, 1e-6))
+    log_freqs = np.log2(freqs)
+    spacing = np.diff(log_freqs)
+    below = np.concatenate((spacing[:1], spacing))
+    above = np.concatenate((spacing, spacing[-1:]))
+    min_width = np.log2((freqs + rate / width) / freqs)
+    below = np.maximum(below, min_width)
+    above = np.maximum(above, min_width)
+
+    # Every (FFT bin, log bin) pair with a non-zero weight, found without a Python loop over the bins.
+    first = np.searchsorted(log_fft, log_freqs - below, side='right')
+    last = np.searchsorted(log_fft, log_freqs + above, side='left')
+    counts = np.maximum(last - first, 0)
+    cols = np.repeat(np.arange(len(freqs)), counts)
+    rows = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(first, counts)
+    distance = log_fft[rows] - log_freqs[cols]
+    weights = 1 - np.where(distance < 0, -distance / below[cols], distance / above[cols])
+
+    kernel = sparse.csc_matrix((weights, (rows, cols)), shape=(len(fft_freqs), len(freqs)))
+    kernel = kernel @ sparse.diags(1 / np.maximum(np.asarray(kernel.sum(axis=0)).ravel(), 1e-12))
+    return kernel.astype(np.float32).tocsr()
+
+def log_spectrogram(samples: np.array, rate: int, width: int = 4096, hop: int = None, window: str = 'hann', tuning: str = 'et', et: int = 12, hertz: float = 0, db: bool = False, floor_db: float = -80) -> tuple:
+    # A uint8 spectrogram with one bin per pitch of the tuning, like stft.spectrogram. Returns (data, freqs).
+    freqs = tuning_freqs(tuning, et, hertz, rate)
+    return stft.spectrogram(samples, width, hop, window, db, floor_db, kernel=make_kernel(freqs, width, rate)), freqs
+
+if __name__ == '__main__':
+    import time
+    from scipy.io import wavfile
+
+    rate, samples = wavfile.read("Recording (2).wav")
+    for tuning, et in [('et', 12), ('et', 24), ('young', 12), ('werckmeister', 12)]:
+        freqs = tuning_freqs(tuning, et, rate=rate)
+        start_time = time.perf_counter()
+        kernel = make_kernel(freqs, 4096, rate)
+        kernel_time = time.perf_counter() - start_time
+        magnitudes = stft.stft(samples, 4096, 512)
+        start_time = time.perf_counter()
+        magnitudes @ kernel
+        apply_time = time.perf_counter() - start_time
+        print(f"{tuning} {et}: {kernel.shape[1]} bins, {kernel.nnz} weights, kernel in {kernel_time * 1000:.1f}ms, {len(magnitudes)} frames mapped in {apply_time * 1000:.1f}ms")
@@ -1,5 +1,10 @@
+import collections
+import numpy as np
 from mido import MidiFile
 
+# Bump this whenever parse_midi's output changes, so cached parses are invalidated.
+PARSER_VERSION = 1
+
 # 
 
 def num_to_str(pitch):
@@ -7,11 +12,13 @@ def num_to_str(pitch):
     return notes[(pitch) % 12][0]
 
 class Note:
-    def __init__(self, pitch: int, velocity: int, duration: float, start: float):
+    def __init__(self, pitch: int, velocity: int, duration: float, start: float, channel: int = 0, track: int = 0):
         self.pitch = pitch
         self.velocity = velocity
         self.duration = duration
         self.start = start
+        self.channel = channel
+        self.track = track
 
     def __repr__(self):
         return f'note: {self.pitch} ({num_to_str(self.pitch)}) {self.velocity} d:{self.duration} s:{self.start}'
@@ -19,42 +26,105 @@ class Note:
     def __str__(self):
         return self.__repr__()
 
-def convert_to_notes(midi_file: str, track: int) -> tuple:
-    f = MidiFile(midi_file)
-    t = f.tracks[track]
+class TempoMap:
+    # Every tempo change in a file, with the time in seconds at which each one starts, so whole arrays of ticks can
+    # be converted to seconds at once.
+    def __init__(self, ticks: np.array, tempos: np.array, ticks_per_beat: int):
+        ticks = np.asarray(ticks, dtype=np.int64)
+        tempos = np.asarray(tempos, dtype=np.float64)
 
-    notes = []
-    current_time = 0
-    current_notes = []
+        # Sort the changes, keeping the last one when several happen on the same tick, and start at the default tempo
+        # if the first change isn't at tick 0.
+        order = np.argsort(ticks, kind='stable')
+        ticks = ticks[order]
+        tempos = tempos[order]
+        last = np.append(ticks[1:] != ticks[:-1], True)[:len(ticks)]
+        ticks = ticks[last]
+        tempos = tempos[last]
+        if not len(ticks) or ticks[0] > 0:
+            ticks = np.insert(ticks, 0, 0)
+            tempos = np.insert(tempos, 0, 500000)
 
-    print(t[:10])
+        self.ticks = ticks
+        self.tempos = tempos
+        self.ticks_per_beat = ticks_per_beat
+        self.seconds_per_tick = tempos / ticks_per_beat / 1e+6
+        self.seconds = np.concatenate(([0], np.cumsum(np.diff(ticks) * self.seconds_per_tick[:-1])))
 
-    for message in t:
-        if message.type != 'note_on' and message.type != 'note_off':
-            continue
+    def to_seconds(self, ticks: np.array) -> np.array:
+        i = np.searchsorted(self.ticks, ticks, side='right') - 1
+        return self.seconds[i] + (ticks - self.ticks[i]) * self.seconds_per_tick[i]
 
-        current_time += message.time
+# One row per note. Ticks are absolute from the start of the file, seconds are derived from them.
+NOTE_DTYPE = np.dtype([
+    ('start_tick', np.int64),
+    ('end_tick', np.int64),
+    ('start', np.float64),
+    ('duration', np.float64),
+    ('pitch', np.int16),
+    ('velocity', np.int16),
+    ('channel', np.int16),
+    ('track', np.int16),
+])
 
-        if message.type == 'note_on':
-            current_notes.append(Note(message.note, message.velocity, None, current_time)) # we wait till the note ends to put in the duration
-        if message.type == 'note_off':
-            # search for the note in the currently playing notes
-            for i, note in enumerate(current_notes):
-                if note.pitch == message.note:
-                    # we found the correct note
-                    current_notes[i].duration = current_time - note.start
-                    notes.append(current_notes[i])
-                    del current_notes[i]
-                    break
+def parse_midi(midi_file: str) -> tuple:
+    # Read the file once and return (notes, tempo_map, ticks_per_beat), where notes is a NOTE_DTYPE array of every
+    # note of every track and channel, sorted by start, timed with every tempo change in the file. Note-offs (and
+    # note-ons with velocity 0) are matched to the oldest sounding note with the same channel and pitch. Notes still
+    # sounding at the end of a track end there.
+    f = MidiFile(midi_file)
 
-    return notes
+    start_ticks = []
+    end_ticks = []
+    pitches = []
+    velocities = []
+    channels = []
+    tracks = []
+    tempo_ticks = []
+    tempos = []
+    for track, t in enumerate(f.tracks):
+        current_time = 0
+        sounding = collections.defaultdict(collections.deque)
+        for message in t:
+            current_time += message.time
+            if message.type == 'note_on' and message.velocity > 0:
+                sounding[message.channel, message.note].append(len(start_ticks))
+                start_ticks.append(current_time)
+                end_ticks.append(current_time)
+                pitches.append(message.note)
+                velocities.append(message.velocity)
+                channels.append(message.channel)
+                tracks.append(track)
+            elif message.type == 'note_off' or message.type == 'note_on':
+                started = sounding.get((message.channel, message.note))
+                if started:
+                    end_ticks[started.popleft()] = current_time
+            elif message.type == 'set_tempo':
+                tempo_ticks.append(current_time)
+                tempos.append(message.tempo)
+        for started in sounding.values():
+            for i in started:
+                end_ticks[i] = current_time
 
-def get_tempo(midi_file: str) -> int:
-    f = MidiFile(midi_file)
-    t = f.tracks[0]
+    notes = np.zeros(len(start_ticks), dtype=NOTE_DTYPE)
+    notes['start_tick'] = start_ticks
+    notes['end_tick'] = end_ticks
+    notes['pitch'] = pitches
+    notes['velocity'] = velocities
+    notes['channel'] = channels
+    notes['track'] = tracks
+    tempo_map = TempoMap(tempo_ticks, tempos, f.ticks_per_beat)
+    notes['start'] = tempo_map.to_seconds(notes['start_tick'])
+    notes['duration'] = tempo_map.to_seconds(notes['end_tick']) - notes['start']
+    notes = notes[np.argsort(notes['start_tick'], kind='stable')]
+    return notes, tempo_map, f.ticks_per_beat
+
+def convert_to_notes(midi_file: str, track: int) -> list:
+    # The notes of one track as Note objects, timed in ticks.
+    notes, _, _ = parse_midi(midi_file)
+    notes = notes[notes['track'] == track]
+    return [Note(int(n['pitch']), int(n['velocity']), int(n['end_tick'] - n['start_tick']), int(n['start_tick']), int(n['channel']), track) for n in notes]
 
-    for message in t:
-        if message.type == 'set_tempo':
-            return message.tempo
-        
-    return 500000
\ No newline at end of file
+def get_tempo(midi_file: str) -> int:
+    # The tempo at the start of the file.
+    return int(parse_midi(midi_file)[1].tempos[0])
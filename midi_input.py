@@ -0,0 +1,48 @@
+import collections
+import time
+from dataclasses import dataclass
+
+NOTE_ON = 0
+NOTE_OFF = 1
+
+@dataclass
+class MIDIEvent:
+    time: float
+    type: int
+    pitch: int
+    velocity: int
+    channel: int
+
+class EventQueue:
+    # A single-producer/single-consumer event queue. deque.append and deque.popleft are atomic, so the MIDI callback
+    # can push while the audio thread drains without either of them taking a lock.
+    def __init__(self):
+        self.events = collections.deque()
+
+    def push(self, event: MIDIEvent):
+        self.events.append(event)
+
+    def drain(self) -> list:
+        events = []
+        while True:
+            try:
+                events.append(self.events.popleft())
+            except IndexError:
+                return events
+
+def message_to_event(message) -> MIDIEvent:
+    # Convert an rtmidi message into a timestamped event, or None if it isn't a note. rtmidi numbers channels 1-16;
+    # events use 0-15, like MIDI files and the rest of the synth.
+    now = time.perf_counter()
+    if message.isNoteOn():
+        return MIDIEvent(now, NOTE_ON, message.getNoteNumber(), message.getVelocity(), message.getChannel() - 1)
+    elif message.isNoteOff():
+        return MIDIEvent(now, NOTE_OFF, message.getNoteNumber(), 0, message.getChannel() - 1)
+
+def make_midi_callback(queue: EventQueue):
+    # Make an rtmidi callback (for RtMidiIn.setCallback) that pushes note events into queue.
+    def callback(message):
+        event = message_to_event(message)
+        if event:
+            queue.push(event)
+    return callback
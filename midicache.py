@@ -0,0 +1,78 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import numpy as np
+import midi
+
+MAX_BYTES = 1 << 30
+
+def cache_key(midi_file: str) -> str:
+    # Key entries by the file's contents and the parser version, so edited files and parser changes both miss.
+    h = hashlib.sha256(f'parser-{midi.PARSER_VERSION}:'.encode())
+    with open(midi_file, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load_entry(path: str) -> tuple:
+    notes = np.load(os.path.join(path, 'notes.npy'), mmap_mode='r')
+    with np.load(os.path.join(path, 'tempo.npz')) as tempo:
+        tempo_map = midi.TempoMap(tempo['ticks'], tempo['tempos'], int(tempo['ticks_per_beat']))
+    return notes, tempo_map, tempo_map.ticks_per_beat
+
+def store_entry(path: str, notes: np.array, tempo_map: midi.TempoMap):
+    # Write the entry to a temporary directory next to it and rename it into place, so readers (including other
+    # batch workers) never see a half-written entry.
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+    temp = tempfile.mkdtemp(dir=cache_dir, prefix='.tmp-')
+    try:
+        np.save(os.path.join(temp, 'notes.npy'), notes)
+        np.savez(os.path.join(temp, 'tempo.npz'), ticks=tempo_map.ticks, tempos=tempo_map.tempos, ticks_per_beat=tempo_map.ticks_per_beat)
+        os.rename(temp, path)
+    except OSError:
+        # Someone else stored the same entry first.
+        shutil.rmtree(temp, ignore_errors=True)
+
+def entry_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def evict(cache_dir: str, max_bytes: int = MAX_BYTES):
+    # Delete the least recently used entries until the cache fits in max_bytes.
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if name.startswith('.') or not os.path.isdir(path):
+            continue
+        try:
+            entries.append((os.path.getmtime(path), entry_size(path), path))
+        except OSError:
+            continue
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+
+def parse_midi_cached(midi_file: str, cache_dir: str = None, max_bytes: int = MAX_BYTES) -> tuple:
+    # midi.parse_midi, but looked up in cache_dir first. Hits are memory-mapped instead of parsed. With no cache_dir
+    # this is just midi.parse_midi.
+    if cache_dir is None:
+        return midi.parse_midi(midi_file)
+
+    path = os.path.join(cache_dir, cache_key(midi_file))
+    if os.path.isdir(path):
+        try:
+            result = load_entry(path)
+            # Mark the entry as recently used.
+            os.utime(path)
+            return result
+        except (OSError, ValueError, KeyError):
+            shutil.rmtree(path, ignore_errors=True)
+
+    notes, tempo_map, ticks_per_beat = midi.parse_midi(midi_file)
+    store_entry(path, notes, tempo_map)
+    evict(cache_dir, max_bytes)
+    return notes, tempo_map, ticks_per_beat
@@ -0,0 +1,102 @@
+import numpy as np
+
+class OscillatorBank:
+    # A bank of oscillators that keeps a phase (in cycles, wrapped to [0, 1)) and a phase increment (in cycles per
+    # sample) per voice, so every active voice can be rendered for a block in one batched 2D operation.
+    def __init__(self, block_size: int, sample_rate: int, capacity: int = 64):
+        self.block_size = block_size
+        self.sample_rate = sample_rate
+        self.phase = np.zeros(capacity)
+        self.increment = np.zeros(capacity)
+        self.free = list(range(capacity - 1, -1, -1))
+        self.ramp = np.arange(block_size, dtype=np.float64)
+        self.work = np.empty((capacity, block_size))
+        self.allocate_wavetable_work(capacity)
+
+    def allocate_wavetable_work(self, capacity: int):
+        # Buffers for render_wavetable, so reading the tables allocates nothing per block.
+        self.index_work = np.empty((capacity, self.block_size), dtype=np.intp)
+        self.pair_work = np.empty((capacity, self.block_size))
+        self.sample_work = np.empty((capacity, self.block_size), dtype=np.float32)
+
+    @property
+    def capacity(self) -> int:
+        return len(self.phase)
+
+    def grow(self):
+        # Double the capacity of the bank, keeping the state of the existing voices.
+        old = self.capacity
+        self.phase = np.concatenate((self.phase, np.zeros(old)))
+        self.increment = np.concatenate((self.increment, np.zeros(old)))
+        self.work = np.empty((old * 2, self.block_size))
+        self.allocate_wavetable_work(old * 2)
+        self.free = list(range(old * 2 - 1, old - 1, -1)) + self.free
+
+    def allocate(self) -> int:
+        # Reserve a slot for a new voice, starting at zero phase.
+        if not self.free:
+            self.grow()
+        slot = self.free.pop()
+        self.phase[slot] = 0
+        self.increment[slot] = 0
+        return slot
+
+    def release(self, slot: int):
+        self.free.append(slot)
+
+    def set_frequency(self, slots: np.array, freqs: np.array):
+        self.increment[slots] = np.asarray(freqs, dtype=np.float64) / self.sample_rate
+
+    def set_increment(self, slots: np.array, increments: np.array):
+        # Like set_frequency, with the frequencies already divided by the sample rate.
+        self.increment[slots] = increments
+
+    def set_phase(self, slots: np.array, offsets: np.array):
+        # Set the phase of every voice in slots so that it crosses zero offsets samples into the next block.
+        slots = np.asarray(slots, dtype=np.intp)
+        self.phase[slots] = np.mod(-self.increment[slots] * offsets, 1.0)
+
+    def render_phase(self, slots: np.array) -> np.array:
+        # Calculate the per-sample phase (in cycles) of every voice in slots for the next block and advance the
+        # phase accumulators. Returns a view into the work buffer, so it is only valid until the next render.
+        slots = np.asarray(slots, dtype=np.intp)
+        phases = self.work[:len(slots)]
+        inc = self.increment[slots]
+        np.multiply(inc[:, None], self.ramp, out=phases)
+        phases += self.phase[slots, None]
+
+        # Carry the phase over to the next block, wrapped so it never loses precision.
+        self.phase[slots] = np.mod(self.phase[slots] + inc * self.block_size, 1.0)
+        return phases
+
+    def render(self, slots: np.array) -> np.array:
+        # Render a sine wave for every voice in slots. Returns a (len(slots), block_size) view into the work buffer.
+        phases = self.render_phase(slots)
+        phases *= 2 * np.pi
+        return np.sin(phases, out=phases)
+
+    def render_wavetable(self, slots: np.array, wavetable) -> np.array:
+        # Render every voice in slots by reading a wavetable, picking the band-limited table for each voice's pitch.
+        # Returns a (len(slots), block_size) float32 view into a work buffer, valid until the next render.
+        slots = np.asarray(slots, dtype=np.intp)
+        n = len(slots)
+        freqs = self.increment[slots] * self.sample_rate
+        phases = self.render_phase(slots)
+        return wavetable.lookup(phases, freqs, self.sample_work[:n], (phases, self.index_work[:n], self.pair_work[:n]))
+
+if __name__ == '__main__':
+    import time
+
+    SAMPLE_RATE = 44100
+    TIMEOUT = 30
+    VOICES = 64
+    BLOCKS = 1000
+
+    bank = OscillatorBank(int(SAMPLE_RATE * TIMEOUT / 1000), SAMPLE_RATE)
+    slots = np.array([bank.allocate() for _ in range(VOICES)])
+    bank.set_frequency(slots, 440 * pow(2, (np.arange(VOICES) - 32) / 12))
+    start_time = time.perf_counter()
+    for _ in range(BLOCKS):
+        bank.render(slots).sum(axis=0)
+    elapsed = (time.perf_counter() - start_time) / BLOCKS
+    print(f"{VOICES} voices: {elapsed * 1000:.3f}ms per {TIMEOUT}ms block ({TIMEOUT / 1000 / elapsed:.1f}x realtime)")
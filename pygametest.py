@@ -1,8 +1,8 @@
 # Simple pygame program
 
 import numpy as np
-from numpy.fft import fft, fftfreq
 from scipy.io import wavfile
+import stft
 
 # Import and initialize the pygame library
 import pygame
@@ -41,12 +41,8 @@ def calc_data():
     total_samples = len(samples)
 
     fft_width = 1000
-    image = np.zeros((int(total_samples / fft_width), int(fft_width/2))) # we divide width by 2 since fft gives a mirrored image
-    for current_stride in range(int(total_samples / fft_width)):
-        fft_out = np.abs(fft(samples[current_stride * fft_width : current_stride * fft_width + fft_width]))
-        image[current_stride] = fft_out[int(fft_width/2):]
-
-    freqs = fftfreq(fft_width, 1./rate)
+    image = stft.stft(samples, fft_width, window=None)
+    freqs = stft.stft_freqs(fft_width, rate)
     return (image, freqs)
 
 data, freq_map = calc_data()
@@ -54,7 +50,8 @@ data, freq_map = calc_data()
 # Cut the data
 max_val = max(data.flatten())
 
-data = (data.T[len(data[0])//12 * 11:]).T
+# Keep the lowest twelfth of the bins, highest frequency first
+data = data[:, 1:len(data[0])//12 + 1][:, ::-1]
 
 print(data.shape)
 
@@ -62,15 +59,12 @@ image = pygame.surfarray.pixels3d(screen)
 
 def render():
     # max_val = 1e+9
-    for i in range(DIMENSIONS[0]):
-        for j in range(DIMENSIONS[1]):
-            ind_y = int(j / DIMENSIONS[1] * len(data[0]))
-            ind_x = int(i / DIMENSIONS[0] * len(data))
-            val = data[ind_x][ind_y]
-            col = int(val / max_val * 256)
-            if col > 255:
-                col = 255
-            image[i][j] = [0, col, col]
+    ind_y = (np.arange(DIMENSIONS[1]) / DIMENSIONS[1] * len(data[0])).astype(np.int64)
+    ind_x = (np.arange(DIMENSIONS[0]) / DIMENSIONS[0] * len(data)).astype(np.int64)
+    col = np.minimum(data[ind_x[:, None], ind_y[None, :]] / max_val * 256, 255).astype(np.uint8)
+    image[:, :, 0] = 0
+    image[:, :, 1] = col
+    image[:, :, 2] = col
 
 render()
 
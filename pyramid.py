@@ -0,0 +1,92 @@
+import os
+import numpy as np
+
+POOL_MODES = ('max', 'mean')
+
+def pool(data: np.array, axis: int, mode: str = 'max') -> np.array:
+    # Halve data along axis by pooling neighbouring pairs. An odd last element is pooled on its own.
+    data = np.moveaxis(data, axis, 0)
+    even = data[:len(data) // 2 * 2].reshape(len(data) // 2, 2, *data.shape[1:])
+    if mode == 'max':
+        pooled = np.maximum(even[:, 0], even[:, 1])
+    else:
+        pooled = ((even[:, 0].astype(np.uint16) + even[:, 1]) >> 1).astype(data.dtype)
+    if len(data) % 2:
+        pooled = np.concatenate((pooled, data[-1:]))
+    return np.ascontiguousarray(np.moveaxis(pooled, 0, axis))
+
+class SpectrogramPyramid:
+    # Mipmaps of a (frames, bins) uint8 spectrogram. Level (x, y) is the spectrogram with every 2**x frames and
+    # every 2**y bins max- or mean-pooled into one, so a zoomed out view can draw one pooled value per pixel instead
+    # of point-sampling. Levels are built on demand from their nearest finer level.
+
+    def __init__(self, data: np.array, mode: str = 'max'):
+        assert mode in POOL_MODES
+        self.mode = mode
+        self.levels = {(0, 0): data}
+        self.max_x = max(int(np.log2(max(data.shape[0], 1))), 0)
+        self.max_y = max(int(np.log2(max(data.shape[1], 1))), 0)
+
+    @property
+    def data(self) -> np.array:
+        return self.levels[(0, 0)]
+
+    def level(self, x: int, y: int) -> np.array:
+        x = min(max(x, 0), self.max_x)
+        y = min(max(y, 0), self.max_y)
+        data = self.levels.get((x, y))
+        if data is None:
+            if x > 0:
+                data = pool(self.level(x - 1, y), 0, self.mode)
+            else:
+                data = pool(self.level(x, y - 1), 1, self.mode)
+            self.levels[(x, y)] = data
+        return data
+
+    def choose_level(self, frames_per_pixel: float, bins_per_pixel: float) -> tuple:
+        # The coarsest level whose frames and bins are still no wider than a pixel.
+        x = int(np.floor(np.log2(max(frames_per_pixel, 1))))
+        y = int(np.floor(np.log2(max(bins_per_pixel, 1))))
+        return min(x, self.max_x), min(y, self.max_y)
+
+    def build(self):
+        for x in range(self.max_x + 1):
+            for y in range(self.max_y + 1):
+                self.level(x, y)
+
+    def save(self, path: str, key: str = ''):
+        # Save every level built so far. key identifies what the spectrogram was computed from, so load can tell
+        # whether the file is stale.
+        temp = path + '.tmp.npz'
+        np.savez(temp, key=key, mode=self.mode, **{f'level_{x}_{y}': data for (x, y), data in self.levels.items()})
+        os.replace(temp, path)
+
+def load_pyramid(path: str, key: str = '') -> SpectrogramPyramid:
+    # Load a saved pyramid, or return None if there is none at path or it was saved with a different key.
+    try:
+        with np.load(path) as f:
+            if str(f['key']) != key:
+                return None
+            pyramid = SpectrogramPyramid(f['level_0_0'], str(f['mode']))
+            for name in f.files:
+                if name.startswith('level_'):
+                    x, y = name.split('_')[1:]
+                    pyramid.levels[(int(x), int(y))] = f[name]
+            return pyramid
+    except (OSError, ValueError, KeyError):
+        return None
+
+if __name__ == '__main__':
+    import time
+    from scipy.io import wavfile
+    import stft
+
+    rate, samples = wavfile.read("Recording (2).wav")
+    data = stft.spectrogram(samples, 1024, 64, db=True)
+    for mode in ['max', 'mean']:
+        start_time = time.perf_counter()
+        pyramid = SpectrogramPyramid(data, mode)
+        pyramid.build()
+        elapsed = time.perf_counter() - start_time
+        size = sum(level.nbytes for level in pyramid.levels.values())
+        print(f"{mode}: {len(pyramid.levels)} levels of a {data.shape} spectrogram in {elapsed * 1000:.1f}ms, {size / data.nbytes:.2f}x the memory")
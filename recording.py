@@ -0,0 +1,206 @@
+import os
+import queue
+import struct
+import threading
+import numpy as np
+from engine import Recorder, SAMPLE_RATE
+
+# The engine's output is scaled down by this much when it is recorded, as WaveRecordContext always has.
+HEADROOM = 1.414
+
+def encode_float32(samples: np.array) -> bytes:
+    return samples.astype('<f4').tobytes()
+
+def encode_int16(samples: np.array) -> bytes:
+    return (np.clip(samples, -1, 1) * 32767).astype('<i2').tobytes()
+
+def encode_int24(samples: np.array) -> bytes:
+    # Pack the low three bytes of every little-endian int32.
+    wide = (np.clip(samples, -1, 1) * 8388607).astype('<i4')
+    return wide.view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+
+def encode_int32(samples: np.array) -> bytes:
+    # Scale in float64: float32 rounds 2147483647 up to 2**31, which wraps around to INT_MIN.
+    return (np.clip(samples, -1, 1) * np.float64(2147483647)).astype('<i4').tobytes()
+
+# Name: (WAV format tag, bytes per sample, encoder, description).
+WAV_FORMATS = {
+    'float32': (3, 4, encode_float32, "32-bit float"),
+    'int32': (1, 4, encode_int32, "32-bit int"),
+    'int24': (1, 3, encode_int24, "24-bit int"),
+    'int16': (1, 2, encode_int16, "16-bit int"),
+}
+
+class WaveWriter:
+    # Writes a mono WAV file in any of WAV_FORMATS. The header is written up front with empty sizes and patched in
+    # place by close, so the samples are written exactly once, straight to their final position.
+    def __init__(self, file, sample_rate: int = SAMPLE_RATE, format: str = 'float32'):
+        self.file = file
+        self.format = format
+        self.format_tag, self.sample_width, self.encode, _ = WAV_FORMATS[format]
+        self.frames = 0
+
+        header = b'WAVE'
+        if self.format_tag == 1:
+            header += b'fmt ' + struct.pack('<IHHIIHH', 16, 1, 1, sample_rate, sample_rate * self.sample_width, self.sample_width, self.sample_width * 8)
+        else:
+            # Non-PCM formats have an (empty) extension size in the fmt chunk and a fact chunk with the frame count.
+            header += b'fmt ' + struct.pack('<IHHIIHHH', 18, self.format_tag, 1, sample_rate, sample_rate * self.sample_width, self.sample_width, self.sample_width * 8, 0)
+            self.fact_pos = 8 + len(header) + 8
+            header += b'fact' + struct.pack('<II', 4, 0)
+        self.file.write(b'RIFF' + struct.pack('<I', 0) + header + b'data' + struct.pack('<I', 0))
+        self.data_pos = self.file.tell()
+
+    def write(self, samples: np.array):
+        self.file.write(self.encode(samples))
+        self.frames += len(samples)
+
+    def close(self):
+        data_size = self.frames * self.sample_width
+        end = self.file.tell()
+        # Chunks are padded to an even length.
+        if data_size % 2:
+            self.file.write(b'\0')
+            end += 1
+        self.file.seek(4)
+        self.file.write(struct.pack('<I', end - 8))
+        if self.format_tag != 1:
+            self.file.seek(self.fact_pos)
+            self.file.write(struct.pack('<I', self.frames))
+        self.file.seek(self.data_pos - 4)
+        self.file.write(struct.pack('<I', data_size))
+        self.file.seek(end)
+        self.file.close()
+
+class FlacWriter:
+    # Writes a mono FLAC file through soundfile (libsndfile), which is only imported when it is needed.
+    # compression_level is FLAC's usual 0 (fastest) to 8 (smallest).
+    def __init__(self, file, sample_rate: int = SAMPLE_RATE, bits: int = 24, compression_level: int = 5):
+        import soundfile
+        self.file = file
+        self.sound_file = soundfile.SoundFile(file, 'w', sample_rate, 1, f'PCM_{bits}', format='FLAC', compression_level=compression_level / 8)
+        self.frames = 0
+
+    def write(self, samples: np.array):
+        # libsndfile wraps around rather than clipping when converting floats to ints.
+        self.sound_file.write(np.clip(samples, -1, 1))
+        self.frames += len(samples)
+
+    def close(self):
+        self.sound_file.close()
+        self.file.close()
+
+class ThreadedRecorder(Recorder):
+    # Hands every block from the audio thread to a writer thread, so disk stalls can't hold up the audio. Blocks are
+    # copied into a fixed pool of preallocated buffers; if the writer falls so far behind that the pool runs out, the
+    # block is dropped and counted rather than waited for. Offline renders can pass blocking=True to wait instead.
+    # The file is written to path + '.part' and renamed to path once it is complete.
+    def __init__(self, path: str, writer_factory, block_size: int, num_blocks: int = 64, blocking: bool = False):
+        self.path = path
+        self.temp_path = path + '.part'
+        self.writer = writer_factory(open(self.temp_path, 'wb'))
+        self.block_size = block_size
+        self.blocking = blocking
+        self.pool = np.zeros((num_blocks, block_size), dtype=np.float32)
+        self.free = queue.Queue()
+        for i in range(num_blocks):
+            self.free.put(i)
+        self.full = queue.Queue()
+        self.blocks_written = 0
+        self.dropped_blocks = 0
+        self.error = None
+        self.thread = threading.Thread(target=self.writer_thread, daemon=True)
+        self.thread.start()
+
+    def write_block(self, buffer: np.array):
+        for start in range(0, len(buffer), self.block_size):
+            chunk = buffer[start:start + self.block_size]
+            try:
+                i = self.free.get(self.blocking)
+            except queue.Empty:
+                self.dropped_blocks += 1
+                continue
+            np.divide(chunk, HEADROOM, out=self.pool[i, :len(chunk)])
+            self.full.put((i, len(chunk)))
+
+    def writer_thread(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                return
+            i, n = item
+            try:
+                if self.error is None:
+                    self.writer.write(self.pool[i, :n])
+                    self.blocks_written += 1
+            except Exception as e:
+                # Keep draining the queue so the audio thread never blocks, and report the error on close.
+                self.error = e
+            finally:
+                self.free.put(i)
+
+    def close(self):
+        self.full.put(None)
+        self.thread.join()
+        self.writer.close()
+        if self.error is not None:
+            os.remove(self.temp_path)
+            raise self.error
+        os.replace(self.temp_path, self.path)
+
+def wave_recorder(path: str, sample_rate: int = SAMPLE_RATE, format: str = 'float32', block_size: int = 1024, num_blocks: int = 64, blocking: bool = False) -> ThreadedRecorder:
+    return ThreadedRecorder(path, lambda file: WaveWriter(file, sample_rate, format), block_size, num_blocks, blocking)
+
+def flac_recorder(path: str, sample_rate: int = SAMPLE_RATE, bits: int = 24, compression_level: int = 5, block_size: int = 1024, num_blocks: int = 64, blocking: bool = False) -> ThreadedRecorder:
+    return ThreadedRecorder(path, lambda file: FlacWriter(file, sample_rate, bits, compression_level), block_size, num_blocks, blocking)
+
+# Every format a recording can be made in: name: (description, file extension).
+RECORD_FORMATS = {name: (description, 'wav') for name, (_, _, _, description) in WAV_FORMATS.items()}
+RECORD_FORMATS['flac24'] = ("24-bit FLAC", 'flac')
+RECORD_FORMATS['flac16'] = ("16-bit FLAC", 'flac')
+
+def make_recorder(path: str, sample_rate: int = SAMPLE_RATE, format: str = 'float32', block_size: int = 1024, compression_level: int = 5, num_blocks: int = 64, blocking: bool = False) -> ThreadedRecorder:
+    # A recorder for any of RECORD_FORMATS. compression_level only applies to FLAC.
+    if format.startswith('flac'):
+        return flac_recorder(path, sample_rate, int(format[4:]), compression_level, block_size, num_blocks, blocking)
+    return wave_recorder(path, sample_rate, format, block_size, num_blocks, blocking)
+
+if __name__ == '__main__':
+    import tempfile
+    import time
+    from engine import TIMEOUT
+    import midi
+    from render import render_notes
+    from tuning import calculate_pitch_et
+    from wavetable import make_wavetables
+
+    # Record a real render rather than a test tone, so the FLAC sizes mean something.
+    notes, _, _ = midi.parse_midi("overworld.mid")
+    audio = render_notes(notes, make_wavetables(SAMPLE_RATE)['sine'], calculate_pitch_et, fade=int(SAMPLE_RATE * TIMEOUT / 1000))
+    block_size = int(SAMPLE_RATE * TIMEOUT / 1000)
+    seconds = len(audio) / SAMPLE_RATE
+    with tempfile.TemporaryDirectory() as d:
+        sizes = {}
+        for format, level in [(format, 5) for format in WAV_FORMATS] + [('flac24', 0), ('flac24', 5), ('flac24', 8), ('flac16', 5)]:
+            # Feed the recorder as fast as the writer keeps up, to measure how much faster than realtime it is.
+            path = os.path.join(d, f'{format}-{level}.{RECORD_FORMATS[format][1]}')
+            recorder = make_recorder(path, SAMPLE_RATE, format, block_size, level, blocking=True)
+            start_time = time.perf_counter()
+            recorder.write_block(audio)
+            recorder.close()
+            elapsed = time.perf_counter() - start_time
+            size = os.path.getsize(path)
+            sizes.setdefault('float32', size)
+            name = f"{format} (level {level})" if format.startswith('flac') else format
+            print(f"{name}: {seconds:.1f}s of audio written in {elapsed:.3f}s ({seconds / elapsed:.0f}x realtime), {size / (1 << 20):.2f}MB ({size / sizes['float32'] * 100:.0f}% of float32 WAV)")
+
+        block = audio[:block_size]
+        recorder = wave_recorder(os.path.join(d, 'drops.wav'), SAMPLE_RATE, 'float32', block_size)
+        costs = []
+        for _ in range(1000):
+            block_start = time.perf_counter()
+            recorder.write_block(block)
+            costs.append(time.perf_counter() - block_start)
+            time.sleep(0.001)
+        recorder.close()
+        print(f"audio thread: {np.median(costs) * 1e+6:.1f}us per block (worst {max(costs) * 1e+6:.0f}us), {recorder.dropped_blocks} blocks dropped")
@@ -0,0 +1,154 @@
+import argparse
+import time
+import numpy as np
+import midicache
+from engine import SynthEngine, WaveRecordContext, SAMPLE_RATE, TIMEOUT
+from midi_input import NOTE_ON, NOTE_OFF
+from tuning import compile_table, get_tuning
+from dynamics import make_compressor, COMPRESSORS
+from wavetable import make_wavetables, WAVEFORMS
+
+def render_notes(notes: np.array, wavetable, calculate_pitch, et: int = 12, hertz: float = 0, volume: float = 100, sample_rate: int = SAMPLE_RATE, fade: int = 0, out: np.array = None) -> np.array:
+    # Render notes (a midi.NOTE_DTYPE array) into one buffer, or add them into out if it is given. Like the live
+    # engine, each note fades in over fade samples and fades out over fade samples after its note-off.
+    starts = (notes['start'] * sample_rate).astype(np.int64)
+    ends = ((notes['start'] + notes['duration']) * sample_rate).astype(np.int64)
+    master = np.zeros(int(ends.max(initial=0)) + fade, dtype=np.float32) if out is None else out
+    ramp = np.arange(fade, dtype=np.float32) / max(fade, 1)
+    table = compile_table(calculate_pitch, et, hertz).tolist()
+
+    for start, end, pitch, velocity in zip(starts.tolist(), ends.tolist(), notes['pitch'].tolist(), notes['velocity'].tolist()):
+        length = end - start + fade
+        freq = table[pitch]
+        # Wrap the phases in float64, so long notes stay as precise as short ones.
+        phases = np.arange(length) * (freq / sample_rate)
+        np.mod(phases, 1.0, out=phases)
+        sample = wavetable.lookup(phases, freq)
+        sample *= velocity / 400 * (volume / 100)
+        if fade:
+            attack = min(fade, length)
+            sample[:attack] *= ramp[:attack]
+            sample[-fade:] *= ramp[::-1]
+        master[start:start + length] += sample
+
+    return master
+
+def note_events(notes: np.array, sample_rate: int = SAMPLE_RATE) -> tuple:
+    # Turn notes (a midi.NOTE_DTYPE array) into note-on/note-off events sorted by sample position, with note-offs
+    # before note-ons on the same sample. Returns (positions, types, pitches, velocities, channels).
+    positions = (np.concatenate((notes['start'], notes['start'] + notes['duration'])) * sample_rate).astype(np.int64)
+    types = np.concatenate((np.full(len(notes), NOTE_ON), np.full(len(notes), NOTE_OFF)))
+    pitches = np.tile(notes['pitch'], 2)
+    velocities = np.tile(notes['velocity'], 2)
+    channels = np.tile(notes['channel'], 2)
+    order = np.lexsort((types != NOTE_OFF, positions))
+    return positions[order], types[order], pitches[order], velocities[order], channels[order]
+
+def render_stream(notes: np.array, engine: SynthEngine, record) -> int:
+    # Render notes block by block through engine, handing each block to record (a Recorder) as soon as it is
+    # rendered. Only the sounding voices and one block are ever held in memory. Returns the number of frames.
+    positions, types, pitches, velocities, channels = (column.tolist() for column in note_events(notes, engine.sample_rate))
+    total = (positions[-1] if positions else 0) + engine.smoothing_length
+    engine.reset()
+    engine.add_recorder(record)
+
+    i = 0
+    frames = 0
+    while frames < total:
+        # Apply the events that fall inside this block at their offsets.
+        block_end = frames + engine.block_size
+        while i < len(positions) and positions[i] < block_end:
+            if types[i] == NOTE_ON:
+                engine.note_on(pitches[i], velocities[i], channels[i], positions[i] - frames)
+            else:
+                engine.note_off(pitches[i], channels[i], positions[i] - frames)
+            i += 1
+        engine.render()
+        frames = block_end
+
+    engine.remove_recorder(record)
+    return frames
+
+def render_file(input: str, output: str, wave: str = 'sine', tuning: str = 'et', et: int = 12, hertz: float = 0, volume: float = 100, no_smoothing: bool = False, sample_rate: int = SAMPLE_RATE, stream: bool = False, block_ms: int = 250, polyphony: int = 256, cache_dir: str = None, cache_max_mb: int = 1024, compressor: str = 'none') -> tuple:
+    # Render the MIDI file input to the WAV file output. Returns (number of notes, number of frames, seconds spent
+    # parsing, seconds spent rendering).
+    start_time = time.perf_counter()
+    notes, _, _ = midicache.parse_midi_cached(input, cache_dir, cache_max_mb << 20)
+    parse_time = time.perf_counter() - start_time
+
+    fade = 0 if no_smoothing else int(sample_rate * TIMEOUT / 1000)
+    with open(output, 'wb') as f:
+        record = WaveRecordContext(f, sample_rate)
+        if stream:
+            engine = SynthEngine(sample_rate, block_ms, polyphony)
+            engine.wave_type = wave
+            engine.calculate_pitch = get_tuning(tuning)
+            engine.et = et
+            engine.hertz = hertz
+            engine.volume = volume
+            engine.should_attack_decay_smoothing = not no_smoothing
+            engine.smoothing_length = fade or 1
+            engine.compressor = make_compressor(compressor, sample_rate)
+            frames = render_stream(notes, engine, record)
+        else:
+            samples = render_notes(notes, make_wavetables(sample_rate)[wave], get_tuning(tuning), et, hertz, volume, sample_rate, fade)
+            master = make_compressor(compressor, sample_rate)
+            if master is not None:
+                samples = master.process_offline(samples)
+            record.write_block(samples)
+            frames = len(samples)
+        record.close()
+
+    return len(notes), frames, parse_time, time.perf_counter() - start_time - parse_time
+
+def add_render_arguments(parser: argparse.ArgumentParser, stream: bool = True):
+    # The options of render_file, shared with batch.py and stems.py.
+    parser.add_argument('--wave', choices=list(WAVEFORMS), default='sine', help="wave type")
+    parser.add_argument('--tuning', default='et', help="tuning system: et, young, werckmeister, or a Scala file as scale.scl or scale.scl,mapping.kbm")
+    parser.add_argument('--et', type=int, default=12, help="number of divisions of the octave for the even-tempered tuning")
+    parser.add_argument('--hertz', type=float, default=0, help="re-tune every note by this many hertz")
+    parser.add_argument('--volume', type=float, default=100, help="volume, in percent")
+    parser.add_argument('--no-smoothing', action='store_true', help="don't apply attack/decay smoothing")
+    parser.add_argument('--sample-rate', type=int, default=SAMPLE_RATE)
+    parser.add_argument('--compressor', choices=COMPRESSORS, default='none', help="dynamics processing on the master bus")
+    parser.add_argument('--cache-dir', default=None, help="cache parsed MIDI files in this directory")
+    parser.add_argument('--cache-max-mb', type=int, default=1024, help="size limit of the cache directory, in megabytes")
+    if not stream:
+        return
+    parser.add_argument('--stream', action='store_true', help="render block by block straight to the output, so memory use doesn't grow with the length of the song")
+    parser.add_argument('--block-ms', type=int, default=250, help="block length in milliseconds when streaming")
+    parser.add_argument('--polyphony', type=int, default=256, help="maximum number of voices when streaming")
+
+def render_options(args: argparse.Namespace) -> dict:
+    return {
+        'wave': args.wave,
+        'tuning': args.tuning,
+        'et': args.et,
+        'hertz': args.hertz,
+        'volume': args.volume,
+        'no_smoothing': args.no_smoothing,
+        'sample_rate': args.sample_rate,
+        'stream': args.stream,
+        'block_ms': args.block_ms,
+        'polyphony': args.polyphony,
+        'cache_dir': args.cache_dir,
+        'cache_max_mb': args.cache_max_mb,
+        'compressor': args.compressor,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a MIDI file to a WAV file, as fast as possible.")
+    parser.add_argument('input', help="MIDI file to render")
+    parser.add_argument('output', help="WAV file to write")
+    add_render_arguments(parser)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    num_notes, frames, _, _ = render_file(args.input, args.output, **render_options(args))
+    elapsed = time.perf_counter() - start_time
+
+    duration = frames / args.sample_rate
+    print(f"rendered {num_notes} notes, {duration:.2f}s of audio in {elapsed:.2f}s ({duration / elapsed:.1f}x realtime)")
+
+if __name__ == '__main__':
+    main()
@@ -2,18 +2,25 @@ import time
 import numpy as np
 import pyaudio
 import midi
+from wavetable import make_wavetables
+from dynamics import Compressor
 
 SAMPLE_RATE = 44100
 FILE = "overworld.mid"
 DURATION = 20
 
 p = pyaudio.PyAudio()
+wavetables = make_wavetables(SAMPLE_RATE)
+
+def generate_wave(wave_type: str, volume: float, sample_rate: int, duration: float, freq: float) -> np.array:
+    phases = np.arange(sample_rate * duration) * (freq / sample_rate)
+    return volume * wavetables[wave_type].lookup(phases, freq)
 
 def generate_sine(volume: float, sample_rate: int, duration: float, freq: float) -> np.array:
-    return volume * (np.sin(2 * np.pi * np.arange(sample_rate * duration) * freq / sample_rate)).astype(np.float32)
+    return generate_wave('sine', volume, sample_rate, duration, freq)
 
 def generate_square(volume: float, sample_rate: int, duration: float, freq: float) -> np.array:
-    return volume * (np.sign(np.sin(2 * np.pi * np.arange(sample_rate * duration) * freq / sample_rate))).astype(np.float32)
+    return generate_wave('square', volume, sample_rate, duration, freq)
 
 def add_sample(master: np.array, sample_rate: int, start: float, sample: np.array):
     if int(sample_rate * start) >= len(master) or (int(sample_rate * start) + len(sample)) >= len(master):
@@ -22,22 +29,19 @@ def add_sample(master: np.array, sample_rate: int, start: float, sample: np.arra
 
 # generate samples, note conversion to float32 array
 samples = generate_square(0, SAMPLE_RATE, DURATION, 440)
-# convert midi into notes
-notes = midi.convert_to_notes(FILE, 1)
-notes += midi.convert_to_notes(FILE, 2)
-tempo = midi.get_tempo(FILE)
+# convert midi into notes, timed in seconds with the file's tempo map
+notes, _, _ = midi.parse_midi(FILE)
+notes = notes[(notes['track'] == 1) | (notes['track'] == 2)]
 
-tempo_div = tempo / 120 / 1e+6
-print(tempo_div)
 for note in notes:
-    duration = note.duration * tempo_div
-    start = note.start * tempo_div
+    duration = float(note['duration'])
+    start = float(note['start'])
     if int(SAMPLE_RATE * start) >= int(SAMPLE_RATE * DURATION) or (int(SAMPLE_RATE * (start + duration)) >= int(SAMPLE_RATE * DURATION)):
         continue
-    freq = pow(2, (note.pitch - 69) / 24) * 440
-    sample = generate_square(note.velocity / 240, SAMPLE_RATE, duration, freq)
+    freq = pow(2, (note['pitch'] - 69) / 24) * 440
+    sample = generate_square(note['velocity'] / 240, SAMPLE_RATE, duration, freq)
     add_sample(samples, SAMPLE_RATE, start, sample)
-    print(f"added sample at {start} for {duration} freq {freq} ({midi.num_to_str(note.pitch)})")
+    print(f"added sample at {start} for {duration} freq {freq} ({midi.num_to_str(note['pitch'])})")
 # cs = generate_sine(0.1, SAMPLE_RATE, 2, 554.37)
 # e = generate_sine(0.1, SAMPLE_RATE, 1, 659.25)
 # aoct = generate_sine(0.1, SAMPLE_RATE, 1, 880.00)
@@ -46,6 +50,9 @@ for note in notes:
 # add_samples(samples, SAMPLE_RATE, 2.0, e)
 # add_samples(samples, SAMPLE_RATE, 2.0, aoct)
 
+# limit the mix so dense chords don't clip
+samples = Compressor.limiter(SAMPLE_RATE).process_offline(samples)
+
 # per @yahweh comment explicitly convert to bytes sequence
 output_bytes = samples.tobytes()
 
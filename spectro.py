@@ -1,24 +1,48 @@
+import collections
+import os
 import numpy as np
-from numpy.fft import fft, fftfreq
 from scipy.io import wavfile
 import pygame
+import stft
+import logfreq
+from lazyspectrogram import LazySpectrogram, read_wav_mmap
+from pyramid import SpectrogramPyramid, load_pyramid
+
+TILE_WIDTH = 128
+MAX_TILES = 256
 
 class Spectrogram:
-    def __init__(self, file):
+    def __init__(self, file, fft_width=1024, hop=None, window='hann', db=False, lazy=False, pooling='max', pyramid_file=None, log=False, tuning='et', et=12, hertz=0):
         self.file = file
         self.zoom_x = 1
-        self.zoom_y = 5
+        self.zoom_y = 1 if log else 5
         self.offset_x = 0
         self.offset_y = 0
-        self.fft_width = 1024
-        self.rate, self.samples = wavfile.read(file)
+        self.fft_width = fft_width
+        self.hop = hop or fft_width
+        self.window = window
+        self.db = db
+        # In log mode there is one bin per pitch of the tuning, instead of linearly spaced FFT bins.
+        self.log = log
+        self.tuning = tuning
+        self.et = et
+        self.hertz = hertz
+        # In lazy mode the file is memory-mapped and only the visible frames are ever computed.
+        self.lazy = lazy
+        # Zoomed out views are drawn from a pyramid of pooled spectrograms, saved to pyramid_file if it is given.
+        self.pooling = pooling
+        self.pyramid_file = pyramid_file
+        self.pyramid = None
+        self.rate, self.samples = read_wav_mmap(file) if lazy else wavfile.read(file)
         self.total_samples = len(self.samples)
 
         pygame.init()
         pygame.display.set_caption("Spectrogram")
         self.dims = [800, 500]
         self.screen = pygame.display.set_mode(self.dims)
-        self.image = pygame.surfarray.pixels3d(self.screen)
+        self.clock = pygame.time.Clock()
+        # Rendered tiles, keyed by zoom, vertical offset and tile index, least recently used first.
+        self.tiles = collections.OrderedDict()
 
         self.calc_fft()
         self.render()
@@ -26,36 +50,74 @@ class Spectrogram:
         self.running = False
 
     def calc_fft(self):
-        self.data = np.zeros((int(self.total_samples / self.fft_width), int(self.fft_width/2))) # we divide width by 2 since fft gives a mirrored image
-        for current_stride in range(int(self.total_samples / self.fft_width)):
-            fft_out = np.abs(fft(self.samples[current_stride * self.fft_width : current_stride * self.fft_width + self.fft_width]))
-            self.data[current_stride] = fft_out[int(self.fft_width/2):]
-        self.freqs = fftfreq(self.fft_width, 1./self.rate)
+        # One row per frame, frequency ascending, already converted into color values.
+        kernel = None
+        self.freqs = stft.stft_freqs(self.fft_width, self.rate)
+        if self.log:
+            self.freqs = logfreq.tuning_freqs(self.tuning, self.et, self.hertz, self.rate)
+            kernel = logfreq.make_kernel(self.freqs, self.fft_width, self.rate)
+        if self.lazy:
+            self.data = LazySpectrogram(self.samples, self.fft_width, self.hop, self.window, self.db, kernel=kernel)
+        else:
+            key = self.pyramid_key()
+            if self.pyramid_file is not None:
+                self.pyramid = load_pyramid(self.pyramid_file, key)
+            if self.pyramid is None:
+                self.pyramid = SpectrogramPyramid(stft.spectrogram(self.samples, self.fft_width, self.hop, self.window, self.db, kernel=kernel), self.pooling)
+                if self.pyramid_file is not None:
+                    self.pyramid.build()
+                    self.pyramid.save(self.pyramid_file, key)
+            self.data = self.pyramid.data
+        self.tiles.clear()
+
+    def pyramid_key(self) -> str:
+        stat = os.stat(self.file)
+        return f'{stat.st_size}-{stat.st_mtime_ns}-{self.fft_width}-{self.hop}-{self.window}-{self.db}-{self.pooling}-{self.log}-{self.tuning}-{self.et}-{self.hertz}'
+
+    def index_maps(self, columns: np.array) -> tuple:
+        # Map screen columns (measured from the left of the whole spectrogram at this zoom) and every screen row
+        # (bottom first) to frame and bin indices. Indices past the end of the data are -1.
+        scaling_factor_y = 1. / self.dims[1] * self.data.shape[1]
+        scaling_factor_x = 1. / self.dims[0] * self.data.shape[0]
+        ind_x = (columns / self.zoom_x * scaling_factor_x).astype(np.int64)
+        ind_y = ((np.arange(self.dims[1]) / self.zoom_y + self.offset_y) * scaling_factor_y).astype(np.int64)
+        ind_x[ind_x >= self.data.shape[0]] = -1
+        ind_y[ind_y >= self.data.shape[1]] = -1
+        return ind_x, ind_y
 
-        self.max_val = max(self.data.flatten())
-        self.data = np.flip(self.data, 1)
+    def render_tile(self, index: int) -> pygame.Surface:
+        ind_x, ind_y = self.index_maps(np.arange(index * TILE_WIDTH, (index + 1) * TILE_WIDTH))
+        if self.pyramid is None:
+            values = self.data.take(np.maximum(ind_x, 0), axis=0)[:, ind_y[::-1]]
+        else:
+            # Read from the coarsest level that still has a frame and a bin per pixel.
+            level_x, level_y = self.pyramid.choose_level(self.data.shape[0] / self.dims[0] / self.zoom_x, self.data.shape[1] / self.dims[1] / self.zoom_y)
+            level = self.pyramid.level(level_x, level_y)
+            values = level.take(np.maximum(ind_x, 0) >> level_x, axis=0)[:, ind_y[::-1] >> level_y]
+        values[(ind_x < 0)[:, None] | (ind_y < 0)[None, ::-1]] = 0
+        pixels = np.zeros((TILE_WIDTH, self.dims[1], 3), dtype=np.uint8)
+        pixels[:, :, 1] = values
+        pixels[:, :, 2] = values
+        return pygame.surfarray.make_surface(pixels)
 
-        # Convert the data into color values.
-        for i in range(len(self.data)):
-            for j in range(len(self.data[0])):
-                self.data[i][j] = int(self.data[i][j] / self.max_val * 256)
-                if self.data[i][j] > 255:
-                    self.data[i][j] = 255
+    def get_tile(self, index: int) -> pygame.Surface:
+        key = (self.zoom_x, self.zoom_y, self.offset_y, index)
+        tile = self.tiles.get(key)
+        if tile is None:
+            tile = self.render_tile(index)
+            self.tiles[key] = tile
+            if len(self.tiles) > MAX_TILES:
+                self.tiles.popitem(last=False)
+        else:
+            self.tiles.move_to_end(key)
+        return tile
 
     def render(self):
+        # Blit the tiles covering the screen, rendering only the ones that aren't cached yet.
         self.screen.fill((0, 0, 0))
-        scaling_factor_y = 1. / self.dims[1] * len(self.data[0])
-        scaling_factor_x = 1. / self.dims[0] * len(self.data)
-        for i in range(self.dims[0]):
-            for j in range(self.dims[1]):
-                ind_y = int((j / self.zoom_y + self.offset_y) * scaling_factor_y)
-                ind_x = int((i / self.zoom_x + self.offset_x) * scaling_factor_x)
-                if ind_y >= len(self.data[0]):
-                    continue
-                if ind_x >= len(self.data):
-                    return
-                val = self.data[ind_x][ind_y]
-                self.image[i][self.dims[1] - j - 1] = [0, val, val]
+        origin = int(round(self.offset_x * self.zoom_x))
+        for index in range(origin // TILE_WIDTH, (origin + self.dims[0] - 1) // TILE_WIDTH + 1):
+            self.screen.blit(self.get_tile(index), (index * TILE_WIDTH - origin, 0))
 
     def run(self):
         self.running = True
@@ -88,7 +150,21 @@ class Spectrogram:
                             self.render()
 
             pygame.display.flip()
+            self.clock.tick(60)
 
 if __name__ == '__main__':
-    app = Spectrogram("Recording (2).wav")
+    import argparse
+    parser = argparse.ArgumentParser(description="Show the spectrogram of a WAV file.")
+    parser.add_argument('file', nargs='?', default="Recording (2).wav", help="WAV file to show")
+    parser.add_argument('--lazy', action='store_true', help="memory-map the file and only compute the visible part of the spectrogram, for very long recordings")
+    parser.add_argument('--fft-width', type=int, default=1024, help="FFT width in samples; log mode needs a wide FFT (e.g. 8192) to tell low notes apart")
+    parser.add_argument('--hop', type=int, default=None, help="samples between frames (defaults to the FFT width)")
+    parser.add_argument('--log', action='store_true', help="show one bin per pitch of the tuning instead of linear frequency")
+    parser.add_argument('--tuning', default='et', help="tuning system for --log: et, young, werckmeister, or a Scala file as scale.scl or scale.scl,mapping.kbm")
+    parser.add_argument('--et', type=int, default=12, help="number of divisions of the octave for the even-tempered tuning")
+    parser.add_argument('--hertz', type=float, default=0, help="re-tune every pitch by this many hertz")
+    parser.add_argument('--pooling', choices=['max', 'mean'], default='max', help="how zoomed out views combine frames and bins")
+    parser.add_argument('--pyramid-file', default=None, help="save the spectrogram pyramid to this file, and load it from there next time")
+    args = parser.parse_args()
+    app = Spectrogram(args.file, args.fft_width, args.hop, lazy=args.lazy, log=args.log, tuning=args.tuning, et=args.et, hertz=args.hertz, pooling=args.pooling, pyramid_file=args.pyramid_file)
     app.run()
\ No newline at end of file
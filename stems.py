@@ -0,0 +1,98 @@
+import argparse
+import os
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import midicache
+from engine import WaveRecordContext, SAMPLE_RATE, TIMEOUT
+from render import render_notes, add_render_arguments
+from dynamics import make_compressor
+from tuning import get_tuning
+from wavetable import make_wavetables
+
+def split_notes(notes: np.array, split: str) -> dict:
+    # Group notes into stems by track or by channel.
+    return {int(key): notes[notes[split] == key] for key in np.unique(notes[split])}
+
+def render_stem(job: tuple):
+    # Render one stem straight into its row of the shared stems array. Runs in a worker process.
+    name, shape, index, notes, wave, tuning, et, hertz, volume, sample_rate, fade = job
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        stems = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        render_notes(notes, make_wavetables(sample_rate)[wave], get_tuning(tuning), et, hertz, volume, sample_rate, fade, out=stems[index])
+        del stems
+    finally:
+        shm.close()
+
+def mixdown(stems: np.array, gains: np.array) -> np.array:
+    # Mix the stems, one per row, into a single buffer with one gain per stem.
+    return np.dot(np.asarray(gains, dtype=np.float32), stems)
+
+def render_stems(notes: np.array, split: str = 'track', gains: dict = None, wave: str = 'sine', tuning: str = 'et', et: int = 12, hertz: float = 0, volume: float = 100, sample_rate: int = SAMPLE_RATE, fade: int = 0, jobs: int = None, stems_dir: str = None) -> tuple:
+    # Render every stem in its own worker into shared memory, then mix them down. gains maps stem keys (track or
+    # channel numbers) to gains; stems not in gains get a gain of 1. Returns (mix, stem keys).
+    if gains is None:
+        gains = {}
+    groups = split_notes(notes, split)
+    keys = list(groups)
+    length = int(((notes['start'] + notes['duration']) * sample_rate).astype(np.int64).max(initial=0)) + fade
+    shape = (len(keys), length)
+
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * 4, 1))
+    try:
+        stems = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+        stems[:] = 0
+        batch = [(shm.name, shape, i, groups[key], wave, tuning, et, hertz, volume, sample_rate, fade) for i, key in enumerate(keys)]
+        with ProcessPoolExecutor(jobs) as executor:
+            list(executor.map(render_stem, batch))
+
+        mix = mixdown(stems, [gains.get(key, 1) for key in keys])
+        if stems_dir is not None:
+            os.makedirs(stems_dir, exist_ok=True)
+            for key, stem in zip(keys, stems):
+                with open(os.path.join(stems_dir, f'{split}{key}.wav'), 'wb') as f:
+                    record = WaveRecordContext(f, sample_rate)
+                    record.write_block(stem)
+                    record.close()
+        del stems
+    finally:
+        shm.close()
+        shm.unlink()
+
+    return mix, keys
+
+def parse_gain(value: str) -> tuple:
+    key, gain = value.split('=')
+    return int(key), float(gain)
+
+def main():
+    parser = argparse.ArgumentParser(description="Render a MIDI file with one worker per track or channel, then mix the stems down.")
+    parser.add_argument('input', help="MIDI file to render")
+    parser.add_argument('output', help="WAV file to write the mix to")
+    parser.add_argument('--split', choices=['track', 'channel'], default='track', help="render one stem per track or per channel")
+    parser.add_argument('--gain', type=parse_gain, action='append', default=[], metavar='STEM=GAIN', help="gain for one stem, e.g. --gain 2=0.5 (can be repeated)")
+    parser.add_argument('--stems-dir', default=None, help="also write every stem as its own WAV file to this directory")
+    parser.add_argument('--jobs', type=int, default=None, help="number of worker processes (defaults to the number of CPUs)")
+    add_render_arguments(parser, stream=False)
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    notes, _, _ = midicache.parse_midi_cached(args.input, args.cache_dir, args.cache_max_mb << 20)
+    fade = 0 if args.no_smoothing else int(args.sample_rate * TIMEOUT / 1000)
+    mix, keys = render_stems(notes, args.split, dict(args.gain), args.wave, args.tuning, args.et, args.hertz, args.volume, args.sample_rate, fade, args.jobs, args.stems_dir)
+    master = make_compressor(args.compressor, args.sample_rate)
+    if master is not None:
+        mix = master.process_offline(mix)
+    with open(args.output, 'wb') as f:
+        record = WaveRecordContext(f, args.sample_rate)
+        record.write_block(mix)
+        record.close()
+    elapsed = time.perf_counter() - start_time
+
+    duration = len(mix) / args.sample_rate
+    print(f"rendered {len(keys)} stems, {duration:.2f}s of audio in {elapsed:.2f}s ({duration / elapsed:.1f}x realtime)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+import numpy as np
+from numpy.fft import rfft, rfftfreq
+from numpy.lib.stride_tricks import sliding_window_view
+
+def to_mono(samples: np.array) -> np.array:
+    if samples.ndim > 1:
+        return samples.mean(axis=1)
+    return samples
+
+def frame_signal(samples: np.array, width: int, hop: int) -> np.array:
+    # A (frames, width) view of samples, one frame every hop samples. No data is copied.
+    if len(samples) < width:
+        return np.zeros((0, width), dtype=samples.dtype)
+    return sliding_window_view(samples, width)[::hop]
+
+def make_window(window: str, width: int) -> np.array:
+    if window is None:
+        return None
+    return {
+        'hann': np.hanning,
+        'hamming': np.hamming,
+        'blackman': np.blackman,
+    }[window](width).astype(np.float32)
+
+def stft(samples: np.array, width: int = 1024, hop: int = None, window: str = 'hann', chunk: int = 4096) -> np.array:
+    # Magnitude spectrogram of samples, as a (frames, width // 2 + 1) float32 array with frequency ascending along
+    # the second axis. hop defaults to width (no overlap); window=None means a rectangular window.
+    hop = hop or width
+    return transform_frames(frame_signal(to_mono(samples), width, hop), window, chunk)
+
+def transform_frames(frames: np.array, window: str = 'hann', chunk: int = 4096) -> np.array:
+    # Magnitudes of the (frames, width) array frames, which needn't be evenly spaced. Frames are transformed chunk at
+    # a time so the temporary windowed copies stay small.
+    width = frames.shape[1]
+    window = make_window(window, width)
+    out = np.empty((len(frames), width // 2 + 1), dtype=np.float32)
+    for i in range(0, len(frames), chunk):
+        block = frames[i:i + chunk].astype(np.float32)
+        if window is not None:
+            block *= window
+        out[i:i + chunk] = np.abs(rfft(block, axis=1))
+    return out
+
+def stft_freqs(width: int, rate: int) -> np.array:
+    return rfftfreq(width, 1. / rate)
+
+def to_db(magnitudes: np.array, floor_db: float = -80, ref: float = None) -> np.array:
+    # Convert magnitudes to decibels relative to ref (by default the loudest bin), clamped at floor_db.
+    ref = max(float(magnitudes.max(initial=0)) if ref is None else ref, 1e-12)
+    return np.maximum(20 * np.log10(np.maximum(magnitudes, ref * pow(10, floor_db / 20)) / ref), floor_db)
+
+def quantize(data: np.array, low: float = None, high: float = None) -> np.array:
+    # Scale data so that low..high maps to 0..255 and convert it to uint8.
+    low = float(data.min(initial=0)) if low is None else low
+    high = float(data.max(initial=0)) if high is None else high
+    scale = 256 / max(high - low, 1e-12)
+    return np.clip((data - low) * scale, 0, 255).astype(np.uint8)
+
+def full_scale(samples: np.array, width: int, window: str = 'hann') -> float:
+    # The magnitude of a full-scale sine wave, for scaling spectrograms of parts of a file the same way.
+    peak = float(np.iinfo(samples.dtype).max) if np.issubdtype(samples.dtype, np.integer) else 1.
+    window = make_window(window, width)
+    return peak * (width if window is None else float(window.sum())) / 2
+
+def spectrogram(samples: np.array, width: int = 1024, hop: int = None, window: str = 'hann', db: bool = False, floor_db: float = -80, ref: float = None, kernel=None) -> np.array:
+    # A uint8 spectrogram, ready to be drawn: linear magnitudes scaled to ref, or decibels from floor_db up to ref.
+    # ref defaults to the loudest bin. kernel is an optional (sparse) matrix mapping the FFT bins to other bins, like
+    # logfreq.make_kernel.
+    return scale_magnitudes(stft(samples, width, hop, window), db, floor_db, ref, kernel)
+
+def scale_magnitudes(magnitudes: np.array, db: bool = False, floor_db: float = -80, ref: float = None, kernel=None) -> np.array:
+    # The second half of spectrogram, for magnitudes that have already been computed.
+    if kernel is not None:
+        magnitudes = np.asarray(magnitudes @ kernel, dtype=np.float32)
+    if db:
+        return quantize(to_db(magnitudes, floor_db, ref), floor_db, 0)
+    return quantize(magnitudes, 0, ref)
+
+if __name__ == '__main__':
+    import time
+    from scipy.io import wavfile
+
+    rate, samples = wavfile.read("Recording (2).wav")
+    for hop in [1024, 256]:
+        start_time = time.perf_counter()
+        data = spectrogram(samples, 1024, hop, db=True)
+        elapsed = time.perf_counter() - start_time
+        print(f"{len(samples) / rate:.1f}s recording, hop {hop}: {data.shape[0]} frames in {elapsed * 1000:.1f}ms")
@@ -0,0 +1,119 @@
+import argparse
+import time
+import numpy as np
+from mido import MidiFile, MidiTrack, Message, MetaMessage
+from scipy.io import wavfile
+import midi
+import stft
+
+def freqs_to_notes(freqs: np.array, et: int = 12) -> np.array:
+    # The nearest even-tempered note (MIDI numbering, A4 = 69 at 440Hz) to every frequency, or -1 for frequencies
+    # that aren't positive.
+    notes = np.full(len(freqs), -1, dtype=np.int64)
+    positive = freqs > 0
+    notes[positive] = np.round(et * np.log2(freqs[positive] / 440) + 69).astype(np.int64)
+    return notes
+
+def note_activations(magnitudes: np.array, freqs: np.array, num_notes: int = 128, et: int = 12) -> np.array:
+    # The loudest bin of every note in every frame, as a (frames, num_notes) array. Bins are ascending in frequency,
+    # so the bins of each note are contiguous and one reduceat finds all the maximums.
+    notes = freqs_to_notes(freqs, et)
+    keep = (notes >= 0) & (notes < num_notes)
+    notes = notes[keep]
+    magnitudes = magnitudes[:, keep]
+    activations = np.zeros((len(magnitudes), num_notes), dtype=magnitudes.dtype)
+    if not len(notes):
+        return activations
+    starts = np.flatnonzero(np.append(True, notes[1:] != notes[:-1]))
+    activations[:, notes[starts]] = np.maximum.reduceat(magnitudes, starts, axis=1)
+    return activations
+
+def pick_peaks(activations: np.array) -> np.array:
+    # Keep only the notes that are louder than both neighbouring notes, so one partial doesn't light up a whole run
+    # of notes around it.
+    padded = np.pad(activations, ((0, 0), (1, 1)))
+    return (activations > padded[:, :-2]) & (activations >= padded[:, 2:])
+
+def track_notes(active: np.array, activations: np.array, ref: float, threshold_db: float, min_frames: int = 2) -> tuple:
+    # Turn a (frames, notes) boolean array into notes: every run of active frames is one note. Returns (pitches,
+    # start frames, end frames, velocities), ordered by pitch then start.
+    edges = np.diff(np.pad(active, ((1, 1), (0, 0))).astype(np.int8), axis=0)
+    pitches, starts = np.nonzero(edges.T == 1)
+    _, ends = np.nonzero(edges.T == -1)
+    long_enough = ends - starts >= min_frames
+    pitches, starts, ends = pitches[long_enough], starts[long_enough], ends[long_enough]
+
+    # The velocity of a note comes from its loudest frame, mapped from threshold_db..0dB onto 1..127.
+    peaks = np.zeros(len(starts), dtype=activations.dtype)
+    if len(starts):
+        flat = activations.T.ravel()
+        bounds = np.stack((pitches * len(activations) + starts, pitches * len(activations) + ends), axis=1).ravel()
+        if bounds[-1] == len(flat):
+            bounds = bounds[:-1]
+        peaks = np.maximum.reduceat(flat, bounds)[0::2]
+    db = 20 * np.log10(np.maximum(peaks, 1e-12) / ref)
+    velocities = np.clip(np.round(1 + (db - threshold_db) / -threshold_db * 126), 1, 127).astype(np.int64)
+    return pitches, starts, ends, velocities
+
+def transcribe(samples: np.array, rate: int, width: int = 4096, hop: int = 512, threshold_db: float = -30, min_frames: int = 2) -> np.array:
+    # Find the notes played in samples, as a midi.NOTE_DTYPE array sorted by start time (ticks are left at 0). A
+    # note is active in a frame when it is a peak among its neighbours and within threshold_db of the loudest note
+    # of the whole recording.
+    magnitudes = stft.stft(samples, width, hop)
+    activations = note_activations(magnitudes, stft.stft_freqs(width, rate))
+    ref = max(float(activations.max(initial=0)), 1e-12)
+    active = pick_peaks(activations) & (activations >= ref * pow(10, threshold_db / 20))
+    pitches, starts, ends, velocities = track_notes(active, activations, ref, threshold_db, min_frames)
+
+    notes = np.zeros(len(pitches), dtype=midi.NOTE_DTYPE)
+    # Frame i covers samples i * hop to i * hop + width; place notes at the centre of their frames.
+    notes['start'] = (starts * hop + width / 2) / rate
+    notes['duration'] = (ends - starts) * hop / rate
+    notes['pitch'] = pitches
+    notes['velocity'] = velocities
+    return notes[np.argsort(notes['start'], kind='stable')]
+
+def write_midi(notes: np.array, file: str, tempo: int = 500000, ticks_per_beat: int = 480):
+    # Write notes (a midi.NOTE_DTYPE array, timed in seconds) to a single-track MIDI file.
+    ticks_per_second = ticks_per_beat * 1e+6 / tempo
+    starts = np.round(notes['start'] * ticks_per_second).astype(np.int64)
+    ends = np.maximum(np.round((notes['start'] + notes['duration']) * ticks_per_second).astype(np.int64), starts + 1)
+
+    # Note-offs sort before note-ons on the same tick.
+    ticks = np.concatenate((ends, starts))
+    is_on = np.concatenate((np.zeros(len(notes), bool), np.ones(len(notes), bool)))
+    pitches = np.tile(notes['pitch'], 2)
+    velocities = np.concatenate((np.zeros(len(notes), np.int64), notes['velocity']))
+    channels = np.tile(notes['channel'], 2)
+    order = np.lexsort((is_on, ticks))
+    deltas = np.diff(ticks[order], prepend=0)
+
+    track = MidiTrack()
+    track.append(MetaMessage('set_tempo', tempo=tempo, time=0))
+    for delta, on, pitch, velocity, channel in zip(deltas.tolist(), is_on[order].tolist(), pitches[order].tolist(), velocities[order].tolist(), channels[order].tolist()):
+        track.append(Message('note_on' if on else 'note_off', note=pitch, velocity=velocity, channel=channel, time=delta))
+    f = MidiFile(ticks_per_beat=ticks_per_beat)
+    f.tracks.append(track)
+    f.save(file)
+
+def main():
+    parser = argparse.ArgumentParser(description="Transcribe a WAV file into a MIDI file.")
+    parser.add_argument('input', help="WAV file to transcribe")
+    parser.add_argument('output', help="MIDI file to write")
+    parser.add_argument('--fft-width', type=int, default=4096, help="FFT width in samples")
+    parser.add_argument('--hop', type=int, default=512, help="samples between frames")
+    parser.add_argument('--threshold-db', type=float, default=-30, help="how far below the loudest note a note still counts as playing")
+    parser.add_argument('--min-frames', type=int, default=2, help="shortest note, in frames")
+    args = parser.parse_args()
+
+    rate, samples = wavfile.read(args.input)
+    start_time = time.perf_counter()
+    notes = transcribe(samples, rate, args.fft_width, args.hop, args.threshold_db, args.min_frames)
+    elapsed = time.perf_counter() - start_time
+    write_midi(notes, args.output)
+
+    duration = len(samples) / rate
+    print(f"transcribed {len(notes)} notes from {duration:.2f}s of audio in {elapsed * 1000:.1f}ms ({duration / elapsed:.0f}x realtime)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+import os
+import numpy as np
+
+def calculate_pitch_et(pitch, et):
+    return pow(2, (pitch - 69) / et) * 440
+
+# Thomas Young 1799 temperament, based on https://www.math.uwaterloo.ca/~mrubinst/tuning/tuning.html.
+YOUNG_RATIOS = [1,1.055730636,1.119771437,1.187696971,1.253888072,1.334745462,1.407640848,1.496510232,1.583595961,1.675749414,1.781545449,1.878842233]
+
+def calculate_pitch_young(pitch, _):
+    # Thomas Young 1799 temperament (based on C=256).
+    return 256 * YOUNG_RATIOS[(pitch) % 12] * pow(2, pitch // 12 - 5)
+
+# Werckmeister temperament, based on https://en.wikipedia.org/wiki/Werckmeister_temperament.
+WERCKMEISTER_RATIOS = [
+    1/1, 256/243, 64/81 * pow(2, 1/2), 32/27, 256/243 * pow(2, 1/4), 4/3, 1024/729, 8/9 * pow(2 ** 3, 1/4), 128/81, 1024/729 * pow(2, 1/4), 16/9, 128/81 * pow(2, 1/4)
+]
+
+def calculate_pitch_werckmeister(pitch, _):
+    # Werckmeister temperament (based on C=256).
+    return 256 * WERCKMEISTER_RATIOS[(pitch) % 12] * pow(2, pitch // 12 - 5)
+
+TUNINGS = {
+    'et': calculate_pitch_et,
+    'young': calculate_pitch_young,
+    'werckmeister': calculate_pitch_werckmeister,
+}
+
+NUM_PITCHES = 128
+
+def compile_table(calculate_pitch, et: int = 12, hertz: float = 0) -> np.array:
+    # The frequency of every MIDI pitch, so the audio thread can look frequencies up instead of calculating them.
+    return np.array([calculate_pitch(pitch, et) for pitch in range(NUM_PITCHES)], dtype=np.float64) + hertz
+
+class TuningTable:
+    # A compiled table of frequencies (and phase increments) for every pitch that is only recompiled when the tuning,
+    # the number of divisions of the octave or the re-tune offset change.
+    def __init__(self, sample_rate: int):
+        self.sample_rate = sample_rate
+        self.key = None
+        self.freqs = None
+        self.increments = None
+        self.num_compiles = 0
+
+    def update(self, calculate_pitch, et: int, hertz: float):
+        key = (calculate_pitch, et, hertz)
+        if key == self.key:
+            return
+        self.freqs = compile_table(calculate_pitch, et, hertz)
+        self.increments = self.freqs / self.sample_rate
+        self.key = key
+        self.num_compiles += 1
+
+def parse_scl(text: str) -> tuple:
+    # Parse a Scala scale file. Returns (description, ratios), where ratios are the scale degrees above 1/1, the last
+    # one being the interval of equivalence (usually the octave). Pitches with a period are in cents, others are
+    # ratios or whole numbers.
+    lines = [line.strip() for line in text.splitlines() if not line.strip().startswith('!')]
+    description = lines[0]
+    count = int(lines[1].split()[0])
+    ratios = []
+    for line in lines[2:2 + count]:
+        value = line.split()[0]
+        if '.' in value:
+            ratios.append(pow(2, float(value) / 1200))
+        elif '/' in value:
+            numerator, denominator = value.split('/')
+            ratios.append(int(numerator) / int(denominator))
+        else:
+            ratios.append(float(int(value)))
+    if len(ratios) != count:
+        raise ValueError(f"expected {count} pitches, found {len(ratios)}")
+    return description, ratios
+
+# Map size, first and last note, middle note, reference note, reference frequency, formal octave degree and the
+# mapping; an empty mapping maps keys to consecutive degrees.
+DEFAULT_KEYMAP = (0, 0, 127, 60, 69, 440., None, [])
+
+def parse_kbm(text: str) -> tuple:
+    # Parse a Scala keyboard mapping file into a tuple laid out like DEFAULT_KEYMAP. Unmapped keys ('x') are None.
+    values = [line.split()[0] for line in text.splitlines() if line.strip() and not line.strip().startswith('!')]
+    size, first, last, middle, reference = (int(value) for value in values[:5])
+    frequency = float(values[5])
+    octave_degree = int(values[6])
+    mapping = [None if value == 'x' else int(value) for value in values[7:7 + size]]
+    mapping += [None] * (size - len(mapping))
+    return size, first, last, middle, reference, frequency, octave_degree, mapping
+
+def scala_table(ratios: list, keymap: tuple = DEFAULT_KEYMAP) -> np.array:
+    # The frequency of every MIDI pitch for a scale and keyboard mapping. Unmapped keys and keys outside the mapped
+    # range are 0Hz.
+    size, first, last, middle, reference, frequency, octave_degree, mapping = keymap
+    degrees_ratios = np.array([1.] + list(ratios[:-1]))
+    octave = ratios[-1]
+    octave_degree = octave_degree or len(ratios)
+
+    def degrees(keys: np.array) -> np.array:
+        # The scale degree of every key, counted from the middle note, or nan for unmapped keys.
+        offsets = keys - middle
+        if not size:
+            return offsets.astype(np.float64)
+        table = np.array([np.nan if degree is None else degree for degree in mapping], dtype=np.float64)
+        return table[offsets % size] + offsets // size * octave_degree
+
+    def degree_ratios(degrees: np.array) -> np.array:
+        mapped = ~np.isnan(degrees)
+        whole = np.where(mapped, degrees, 0).astype(np.int64)
+        return np.where(mapped, degrees_ratios[whole % len(ratios)] * np.power(octave, whole // len(ratios)), 0)
+
+    keys = np.arange(NUM_PITCHES)
+    reference_ratio = degree_ratios(degrees(np.array([reference])))[0]
+    if not reference_ratio:
+        raise ValueError("the reference note isn't mapped")
+    table = frequency / reference_ratio * degree_ratios(degrees(keys))
+    table[(keys < first) | (keys > last)] = 0
+    return table
+
+def scala_tuning(scl_file: str, kbm_file: str = None):
+    # A calculate_pitch function (ignoring et, like the Young and Werckmeister tunings) for a Scala scale and
+    # optional keyboard mapping.
+    with open(scl_file) as f:
+        _, ratios = parse_scl(f.read())
+    keymap = DEFAULT_KEYMAP
+    if kbm_file is not None:
+        with open(kbm_file) as f:
+            keymap = parse_kbm(f.read())
+    table = scala_table(ratios, keymap).tolist()
+    def calculate_pitch_scala(pitch, _):
+        return table[pitch]
+    return calculate_pitch_scala
+
+def get_tuning(name: str):
+    # One of TUNINGS by name, or a Scala tuning given as "scale.scl" or "scale.scl,mapping.kbm".
+    if name in TUNINGS:
+        return TUNINGS[name]
+    scl_file, _, kbm_file = name.partition(',')
+    if not os.path.splitext(scl_file)[1].lower() == '.scl':
+        raise ValueError(f"unknown tuning {name!r}: expected one of {', '.join(TUNINGS)} or a .scl file")
+    return scala_tuning(scl_file, kbm_file or None)
+
+if __name__ == '__main__':
+    import time
+
+    COMPILES = 1000
+    for name, calculate_pitch in TUNINGS.items():
+        start_time = time.perf_counter()
+        for i in range(COMPILES):
+            compile_table(calculate_pitch, 12 + i % 2, 0)
+        elapsed = (time.perf_counter() - start_time) / COMPILES
+        print(f"{name}: table compiled in {elapsed * 1e+6:.1f}us")
+
+    _, ratios = parse_scl("! 12-tet.scl\n12 equal\n 12\n!\n" + "".join(f" {i * 100}.0\n" for i in range(1, 13)))
+    start_time = time.perf_counter()
+    for _ in range(COMPILES):
+        table = scala_table(ratios)
+    elapsed = (time.perf_counter() - start_time) / COMPILES
+    print(f"scala: table compiled in {elapsed * 1e+6:.1f}us, max error against 12-et {np.abs(table - compile_table(calculate_pitch_et)).max():.2e}Hz")
+
+    table = compile_table(calculate_pitch_et)
+    pitches = np.random.randint(0, NUM_PITCHES, 64)
+    start_time = time.perf_counter()
+    for _ in range(COMPILES):
+        [calculate_pitch_et(pitch, 12) for pitch in pitches.tolist()]
+    calculate_time = (time.perf_counter() - start_time) / COMPILES
+    start_time = time.perf_counter()
+    for _ in range(COMPILES):
+        table[pitches]
+    gather_time = (time.perf_counter() - start_time) / COMPILES
+    print(f"64 voices per block: {calculate_time * 1e+6:.1f}us calculated, {gather_time * 1e+6:.1f}us gathered from the table")
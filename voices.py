@@ -0,0 +1,92 @@
+import numpy as np
+
+STEAL_OLDEST = 'oldest'
+STEAL_QUIETEST = 'quietest'
+
+class VoiceTable:
+    # A fixed number of voice slots, stored as struct-of-arrays. Each (channel, pitch) maps to the slot of its held
+    # voice, so note-offs are O(1), and once every slot is in use a new note steals one, so rendering cost is bounded
+    # by the polyphony limit. The slots index straight into the engine's OscillatorBank, which holds the phases.
+    def __init__(self, polyphony: int = 64, steal_policy: str = STEAL_OLDEST):
+        self.polyphony = polyphony
+        self.steal_policy = steal_policy
+        self.active = np.zeros(polyphony, dtype=bool)
+        self.is_new = np.zeros(polyphony, dtype=bool)
+        self.pitch = np.zeros(polyphony, dtype=np.int64)
+        self.velocity = np.zeros(polyphony, dtype=np.int64)
+        self.channel = np.zeros(polyphony, dtype=np.int64)
+        self.age = np.zeros(polyphony, dtype=np.int64)
+        # Sample offsets of the note-on and note-off, relative to the start of the current block. A voice that hasn't
+        # been released has a release of infinity.
+        self.start = np.zeros(polyphony)
+        self.release = np.full(polyphony, np.inf)
+        self.held = np.full((16, 128), -1, dtype=np.intp)
+        self.free = list(range(polyphony - 1, -1, -1))
+        self.num_note_ons = 0
+        self.num_stolen = 0
+
+    def count(self) -> int:
+        return self.polyphony - len(self.free)
+
+    def active_slots(self) -> np.array:
+        return np.flatnonzero(self.active)
+
+    def free_slot(self, slot: int):
+        if self.release[slot] == np.inf:
+            self.held[self.channel[slot] % 16, self.pitch[slot]] = -1
+        self.active[slot] = False
+        self.is_new[slot] = False
+        self.release[slot] = np.inf
+        self.free.append(slot)
+
+    def steal(self) -> int:
+        # Pick a voice to cut, preferring ones that are already releasing.
+        candidates = self.active_slots()
+        releasing = candidates[self.release[candidates] != np.inf]
+        if len(releasing):
+            candidates = releasing
+        if self.steal_policy == STEAL_QUIETEST:
+            order = np.lexsort((self.age[candidates], self.velocity[candidates]))
+        else:
+            order = np.argsort(self.age[candidates])
+        slot = candidates[order[0]]
+        self.free_slot(slot)
+        self.num_stolen += 1
+        return slot
+
+    def note_on(self, pitch: int, velocity: int, channel: int = 0, offset: int = 0) -> int:
+        # A note that is already held on this channel is released first, so it fades out under the new one.
+        self.note_off(pitch, channel, offset)
+        if not self.free:
+            self.steal()
+        slot = self.free.pop()
+        self.active[slot] = True
+        self.is_new[slot] = True
+        self.pitch[slot] = pitch
+        self.velocity[slot] = velocity
+        self.channel[slot] = channel
+        self.age[slot] = self.num_note_ons
+        self.start[slot] = offset
+        self.release[slot] = np.inf
+        self.held[channel % 16, pitch] = slot
+        self.num_note_ons += 1
+        return slot
+
+    def note_off(self, pitch: int, channel: int = 0, offset: int = 0) -> int:
+        # Release the held voice for this note, if there is one. Returns its slot, or -1.
+        slot = self.held[channel % 16, pitch]
+        if slot < 0:
+            return -1
+        self.release[slot] = offset
+        self.held[channel % 16, pitch] = -1
+        return slot
+
+    def advance(self, block_size: int, fade: int):
+        # Move on to the next block, freeing the voices that finished fading out during this one.
+        slots = self.active_slots()
+        finished = slots[self.release[slots] + fade <= block_size]
+        self.start[slots] -= block_size
+        self.release[slots] -= block_size
+        self.is_new[slots] = False
+        for slot in finished:
+            self.free_slot(slot)
@@ -0,0 +1,123 @@
+import numpy as np
+
+TABLE_SIZE = 2048
+
+class Wavetable:
+    # A set of precomputed single-cycle tables, one per octave, each band-limited so that none of its harmonics go
+    # above the Nyquist frequency for the notes in that octave. Tables are read by fractional phase (in cycles) with
+    # linear interpolation. The table size must be a power of two.
+    def __init__(self, tables: np.array, base_freq: float):
+        self.octaves, self.size = tables.shape
+        # Store every sample next to the step to the one after it (wrapping around at the end of each table), as one
+        # float64 per pair of float32s, so that interpolating takes a single gather.
+        pairs = np.empty((self.octaves, self.size, 2), dtype=np.float32)
+        pairs[:, :, 0] = tables
+        pairs[:, :, 1] = np.roll(tables, -1, axis=1) - tables
+        self.pairs = pairs.ravel().view(np.float64)
+        self.base_freq = base_freq
+
+    def octave(self, freqs: np.array) -> np.array:
+        # Select the table for each frequency.
+        octave = np.floor(np.log2(np.maximum(np.asarray(freqs, dtype=np.float64), self.base_freq) / self.base_freq))
+        return np.minimum(octave, self.octaves - 1).astype(np.intp)
+
+    def lookup(self, phases: np.array, freqs: np.array, out: np.array = None, work: tuple = None) -> np.array:
+        # Read the tables at phases (in cycles), which is (voices, samples) with one frequency per voice, or a single
+        # row of samples for a single frequency. Returns float32 samples, in out if it is given. work can be a tuple of
+        # (float64, intp, float64) buffers shaped like phases to use instead of allocating; the first may be phases.
+        if work is None:
+            work = (np.empty(np.shape(phases)), np.empty(np.shape(phases), dtype=np.intp), np.empty(np.shape(phases)))
+        positions, indices, pairs = work
+        if out is None:
+            out = np.empty(np.shape(phases), dtype=np.float32)
+        offsets = self.octave(freqs) * self.size
+        if np.ndim(phases) > 1:
+            offsets = offsets[:, None]
+
+        # Split the phases into a whole number of table steps and a fraction, in float64, and wrap the steps into a
+        # single cycle as integers, so long runs of absolute phases keep their precision.
+        np.multiply(phases, self.size, out=positions)
+        np.floor(positions, out=pairs)
+        np.copyto(indices, pairs, casting='unsafe')
+        positions -= pairs
+        indices &= self.size - 1
+        indices += offsets
+
+        # Interpolate from each sample along the step to the next one.
+        np.take(self.pairs, indices, out=pairs)
+        steps = pairs.view(np.float32)
+        np.copyto(out, positions, casting='same_kind')
+        out *= steps[..., 1::2]
+        out += steps[..., ::2]
+        return out
+
+def make_wavetable(harmonics, sample_rate: int, size: int = TABLE_SIZE) -> Wavetable:
+    # Build a band-limited wavetable from harmonics, a function of the harmonic numbers returning the amplitude of
+    # the sine component for each harmonic.
+    base_freq = sample_rate / size
+    octaves = max(int(np.log2(sample_rate / 2 / base_freq)), 1)
+    n = np.arange(1, size // 2)
+    amplitudes = np.asarray(harmonics(n), dtype=np.float64)
+
+    tables = np.empty((octaves, size))
+    for octave in range(octaves):
+        # Only keep the harmonics that stay below Nyquist for the highest note in the octave.
+        top = base_freq * pow(2, octave + 1)
+        spectrum = np.zeros(size // 2 + 1, dtype=np.complex128)
+        spectrum[1:size // 2] = np.where(n * top < sample_rate / 2, amplitudes, 0) * -0.5j * size
+        spectrum[1] = amplitudes[0] * -0.5j * size
+        tables[octave] = np.fft.irfft(spectrum, size)
+
+    # Normalize so the lowest (fullest) table peaks at 1.
+    tables /= np.max(np.abs(tables[0]))
+    return Wavetable(tables, base_freq)
+
+def sine_harmonics(n: np.array) -> np.array:
+    return (n == 1).astype(np.float64)
+
+def square_harmonics(n: np.array) -> np.array:
+    return np.where(n % 2 == 1, 4 / (np.pi * n), 0)
+
+def saw_harmonics(n: np.array) -> np.array:
+    return 2 / (np.pi * n) * np.where(n % 2 == 1, 1, -1)
+
+def triangle_harmonics(n: np.array) -> np.array:
+    return np.where(n % 2 == 1, 8 / (np.pi * n) ** 2 * np.where(n % 4 == 1, 1, -1), 0)
+
+WAVEFORMS = {
+    'sine': sine_harmonics,
+    'square': square_harmonics,
+    'saw': saw_harmonics,
+    'triangle': triangle_harmonics,
+}
+
+def make_wavetables(sample_rate: int, size: int = TABLE_SIZE) -> dict:
+    return {name: make_wavetable(harmonics, sample_rate, size) for name, harmonics in WAVEFORMS.items()}
+
+if __name__ == '__main__':
+    import time
+    from oscillator import OscillatorBank
+
+    SAMPLE_RATE = 44100
+    TIMEOUT = 30
+    VOICES = 64
+    BLOCKS = 1000
+
+    tables = make_wavetables(SAMPLE_RATE)
+    bank = OscillatorBank(int(SAMPLE_RATE * TIMEOUT / 1000), SAMPLE_RATE)
+    slots = np.array([bank.allocate() for _ in range(VOICES)])
+    freqs = 440 * pow(2, (np.arange(VOICES) - 32) / 12)
+    bank.set_frequency(slots, freqs)
+
+    for name, render in [("np.sin", lambda: bank.render(slots)), ("np.sin/np.sign", lambda: np.sign(bank.render(slots)))]:
+        start_time = time.perf_counter()
+        for _ in range(BLOCKS):
+            render()
+        elapsed = (time.perf_counter() - start_time) / BLOCKS
+        print(f"{name}: {elapsed * 1000:.3f}ms per {TIMEOUT}ms block")
+    for name, table in tables.items():
+        start_time = time.perf_counter()
+        for _ in range(BLOCKS):
+            bank.render_wavetable(slots, table)
+        elapsed = (time.perf_counter() - start_time) / BLOCKS
+        print(f"{name} wavetable: {elapsed * 1000:.3f}ms per {TIMEOUT}ms block")